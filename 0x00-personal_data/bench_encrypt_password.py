@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Throughput of HashingService as the worker count grows.
+
+Usage: ./bench_encrypt_password.py [hashes_per_worker]
+"""
+import os
+import sys
+import time
+
+from encrypt_password import HashingService
+
+
+def throughput(workers: int, count: int) -> float:
+    """Returns bcrypt hashes per second using the given worker count."""
+    with HashingService(max_workers=workers) as service:
+        start = time.perf_counter()
+        futures = [service.submit_hash("password{}".format(i))
+                   for i in range(count)]
+        for future in futures:
+            future.result()
+        return count / (time.perf_counter() - start)
+
+
+def main(per_worker: int = 8) -> None:
+    """Prints hashes/second for 1, 2, 4, ... up to the core count."""
+    cores = os.cpu_count() or 1
+    workers = 1
+    print("{:>8} {:>12} {:>9}".format("workers", "hashes/s", "speedup"))
+    baseline = None
+    while True:
+        rate = throughput(workers, per_worker * workers)
+        baseline = baseline or rate
+        print("{:>8} {:>12.1f} {:>8.2f}x".format(
+            workers, rate, rate / baseline))
+        if workers >= cores:
+            break
+        workers = min(workers * 2, cores)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
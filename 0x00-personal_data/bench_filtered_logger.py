@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the redaction paths of filtered_logger.
+
+Usage: ./bench_filtered_logger.py [count,count,...]
+"""
+import io
+import logging
+import random
+import re
+import string
+import sys
+import time
+from typing import Callable, List
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_engine
+from filtered_logger import get_logger
+from filtered_logger import patterns
+
+DEFAULT_COUNTS = (1000, 100000, 1000000)
+POOL_SIZE = 1000
+FACTORY_CALLS = (1, 10, 100)
+COLUMNS = ("name", "email", "phone", "ssn", "password",
+           "ip", "last_login", "user_agent")
+
+
+def synthetic_messages(size: int = POOL_SIZE) -> List[str]:
+    """Builds a pool of users-table shaped log messages."""
+    rng = random.Random(0)
+    letters = string.ascii_letters + string.digits
+    messages = []
+    for _ in range(size):
+        values = ("".join(rng.choices(letters, k=rng.randint(6, 24)))
+                  for _ in COLUMNS)
+        pairs = ("{}={}".format(c, v) for c, v in zip(COLUMNS, values))
+        messages.append("; ".join(pairs) + ";")
+    return messages
+
+
+def legacy_redact(message: str) -> str:
+    """The original per-call path: rebuild the pattern, hit re's cache."""
+    extract, replace = patterns["extract"], patterns["replace"]
+    return re.sub(extract(PII_FIELDS, RedactingFormatter.SEPARATOR),
+                  replace(RedactingFormatter.REDACTION), message)
+
+
+def per_record(fn: Callable, pool: list, count: int) -> float:
+    """Returns the mean cost of fn in nanoseconds per record."""
+    size = len(pool)
+    start = time.perf_counter_ns()
+    for i in range(count):
+        fn(pool[i % size])
+    return (time.perf_counter_ns() - start) / count
+
+
+def main(counts=DEFAULT_COUNTS) -> None:
+    """Prints the per-record cost of each redaction path."""
+    pool = synthetic_messages()
+    formatter = RedactingFormatter(PII_FIELDS)
+    records = [logging.LogRecord("user_data", logging.INFO, None, None,
+                                 msg, None, None) for msg in pool]
+    paths = {
+        "legacy re.sub": legacy_redact,
+        "engine.redact": formatter._engine.redact,
+        "tokenize.redact": get_engine(
+            PII_FIELDS, RedactingFormatter.REDACTION,
+            RedactingFormatter.SEPARATOR, "tokenize").redact,
+    }
+    print("{:>10} {:>18} {:>14}".format("records", "path", "ns/record"))
+    for count in counts:
+        for label, fn in paths.items():
+            cost = per_record(fn, pool, count)
+            print("{:>10} {:>18} {:>14.1f}".format(count, label, cost))
+        cost = per_record(formatter.format, records, count)
+        print("{:>10} {:>18} {:>14.1f}".format(count, "formatter", cost))
+    factory_regression(records, min(counts))
+
+
+def factory_regression(records: list, count: int) -> None:
+    """Per-record cost after calling get_logger() repeatedly; it should
+    not grow with the number of calls."""
+    print("{:>10} {:>18} {:>14}".format("calls", "handlers", "ns/record"))
+    for calls in FACTORY_CALLS:
+        for _ in range(calls):
+            logger = get_logger()
+        for handler in logger.handlers:
+            handler.setStream(io.StringIO())
+        cost = per_record(logger.handle, records, count)
+        print("{:>10} {:>18} {:>14.1f}".format(
+            calls, len(logger.handlers), cost))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(tuple(int(n) for n in sys.argv[1].split(",")))
+    else:
+        main()
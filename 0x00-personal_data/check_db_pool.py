@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Exercises db_pool.ConnectionPool against the sqlite3 stand-in.
+
+Usage: ./check_db_pool.py
+
+Each check prints one line and exits non-zero on the first failure; no
+MySQL server is needed.
+"""
+import sys
+import threading
+import time
+from typing import Callable, List
+
+from db_pool import ConnectionPool, PoolTimeout, SQLiteConnection
+
+
+class CountingFactory:
+    """SQLiteConnection factory that remembers what it built."""
+
+    def __init__(self):
+        self.built: List[SQLiteConnection] = []
+
+    def __call__(self) -> SQLiteConnection:
+        conn = SQLiteConnection()
+        self.built.append(conn)
+        return conn
+
+
+def check_reuse() -> None:
+    """A released connection is handed out again."""
+    factory = CountingFactory()
+    pool = ConnectionPool(factory, size=2)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert len(factory.built) == 1
+
+
+def check_query() -> None:
+    """connection() yields a working connection with %s placeholders."""
+    pool = ConnectionPool(CountingFactory(), size=1)
+    with pool.connection() as conn:
+        with conn.cursor(buffered=False) as cursor:
+            cursor.execute("SELECT %s + %s", (1, 2))
+            assert cursor.fetchone() == (3,)
+
+
+def check_timeout() -> None:
+    """acquire() raises PoolTimeout once every slot is checked out."""
+    pool = ConnectionPool(CountingFactory(), size=1, timeout=0.05)
+    held = pool.acquire()
+    start = time.monotonic()
+    try:
+        pool.acquire()
+    except PoolTimeout:
+        pass
+    else:
+        raise AssertionError("second acquire did not time out")
+    assert time.monotonic() - start >= 0.05
+    pool.release(held)
+    pool.release(pool.acquire())
+
+
+def check_waiter() -> None:
+    """A blocked acquire() proceeds when another thread releases."""
+    pool = ConnectionPool(CountingFactory(), size=1, timeout=2)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(held)
+    waiter.join()
+    assert got == [held]
+
+
+def check_stale() -> None:
+    """Connections idle longer than max_idle are closed and replaced."""
+    factory = CountingFactory()
+    pool = ConnectionPool(factory, size=1, max_idle=0.05)
+    first = pool.acquire()
+    pool.release(first)
+    time.sleep(0.1)
+    second = pool.acquire()
+    assert second is not first
+    assert not first.is_connected()
+    assert len(factory.built) == 2
+
+
+def check_unhealthy() -> None:
+    """A connection failing is_connected() is replaced on checkout."""
+    factory = CountingFactory()
+    pool = ConnectionPool(factory, size=1)
+    first = pool.acquire()
+    pool.release(first)
+    first.close()
+    assert pool.acquire() is not first
+
+
+def check_discard_on_error() -> None:
+    """A with block that raises discards its connection."""
+    factory = CountingFactory()
+    pool = ConnectionPool(factory, size=1)
+    try:
+        with pool.connection():
+            raise KeyError("boom")
+    except KeyError:
+        pass
+    assert not factory.built[0].is_connected()
+    with pool.connection() as conn:
+        assert conn is not factory.built[0]
+
+
+def check_close() -> None:
+    """close() closes idle connections and refuses new checkouts."""
+    factory = CountingFactory()
+    pool = ConnectionPool(factory, size=2)
+    pool.release(pool.acquire())
+    pool.close()
+    assert not factory.built[0].is_connected()
+    try:
+        pool.acquire()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("closed pool handed out a connection")
+
+
+CHECKS: List[Callable[[], None]] = [
+    check_reuse,
+    check_query,
+    check_timeout,
+    check_waiter,
+    check_stale,
+    check_unhealthy,
+    check_discard_on_error,
+    check_close,
+]
+
+
+def main() -> int:
+    """Runs every check and returns the process exit status."""
+    for check in CHECKS:
+        try:
+            check()
+        except Exception as exc:
+            print("FAIL {}: {!r}".format(check.__name__, exc))
+            return 1
+        print("ok   {}".format(check.__name__))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
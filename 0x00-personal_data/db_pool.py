@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""A small connection pool for the personal data database."""
+
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the pool timeout."""
+
+
+class ConnectionPool:
+    """Hands out reusable connections built by a factory.
+
+    At most `size` connections exist at once. Idle connections older
+    than `max_idle` seconds, or failing `is_connected()`, are dropped on
+    checkout and replaced with a fresh one.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = 5,
+        max_idle: float = 300.0,
+        timeout: float = None,
+    ):
+        self._factory = factory
+        self.size = size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def acquire(self) -> Any:
+        """Checks out a healthy connection, waiting for a free slot."""
+        if self._closed:
+            raise RuntimeError("pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout("no connection available")
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._factory()
+                stale = time.monotonic() - last_used > self.max_idle
+                if not stale and self._healthy(conn):
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        """Returns a connection to the pool, or closes it if discard."""
+        try:
+            if discard or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Checks a connection out for the duration of a with block;
+        it is discarded if the block raises."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, discard=True)
+            raise
+        self.release(conn)
+
+    def close(self) -> None:
+        """Closes every idle connection and refuses new checkouts."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    @staticmethod
+    def _healthy(conn: Any) -> bool:
+        """Health check run on checkout."""
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(conn: Any) -> None:
+        """Closes a connection, ignoring errors from dead sockets."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class SQLiteConnection:
+    """sqlite3-backed stand-in for a mysql.connector connection, for
+    exercising the pool without a MySQL server."""
+
+    def __init__(self, database: str = ":memory:"):
+        self._conn = sqlite3.connect(database, check_same_thread=False)
+        self._open = True
+
+    def is_connected(self) -> bool:
+        """Pings the database like MySQLConnection.is_connected."""
+        if not self._open:
+            return False
+        try:
+            self._conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def cursor(self, buffered: bool = None) -> "SQLiteCursor":
+        """Returns a cursor; buffered is accepted for compatibility."""
+        return SQLiteCursor(self._conn.cursor())
+
+    def commit(self) -> None:
+        """Commits the current transaction."""
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Closes the underlying sqlite3 connection."""
+        self._open = False
+        self._conn.close()
+
+
+class SQLiteCursor:
+    """Cursor wrapper accepting mysql's %s placeholders."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def __enter__(self) -> "SQLiteCursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def execute(self, query: str, params: tuple = ()) -> None:
+        """Runs a query written for mysql.connector."""
+        self._cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchone(self) -> tuple:
+        """Returns the next row or None."""
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int = 1) -> list:
+        """Returns up to size rows."""
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self) -> list:
+        """Returns the remaining rows."""
+        return self._cursor.fetchall()
+
+    def close(self) -> None:
+        """Closes the cursor."""
+        self._cursor.close()
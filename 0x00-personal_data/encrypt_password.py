@@ -2,35 +2,229 @@
 """
 Module for hashing and verifying passwords using bcrypt.
 """
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
 import bcrypt
 from bcrypt import hashpw
 
+BCRYPT_ROUNDS = int(os.getenv("PERSONAL_DATA_BCRYPT_ROUNDS", "12"))
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
 
-def hash_password(password: str) -> bytes:
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
     Hashes a password using bcrypt.
 
     Args:
         password (str): The password to hash.
+        rounds (int): Work factor, defaults to BCRYPT_ROUNDS.
 
     Returns:
         bytes: The hashed password.
     """
     b = password.encode()
-    hashed = hashpw(b, bcrypt.gensalt())
+    hashed = hashpw(b, bcrypt.gensalt(rounds or BCRYPT_ROUNDS))
     return hashed
 
 
-def is_valid(hashed_password: bytes, password: str) -> bool:
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    Reads the work factor out of a bcrypt hash ($2b$<rounds>$...).
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes, rounds: int = None) -> bool:
+    """
+    Tells whether a hash was made with a cost other than the configured one.
+    """
+    return hash_rounds(hashed_password) != (rounds or BCRYPT_ROUNDS)
+
+
+def is_valid(
+    hashed_password: bytes,
+    password: str,
+    on_rehash: Callable[[bytes], None] = None,
+) -> bool:
     """
     Verifies a password against a given hashed password.
 
     Args:
         hashed_password (bytes): The stored hashed password.
         password (str): The password to validate.
+        on_rehash (callable): Called with a fresh hash when the password
+        matches but the stored hash uses an outdated cost, so the
+        caller can persist it.
 
     Returns:
         bool: True if the password matches
         the hashed password, False otherwise.
     """
-    return bcrypt.checkpw(password.encode(), hashed_password)
+    valid = bcrypt.checkpw(password.encode(), hashed_password)
+    if valid and on_rehash is not None and needs_rehash(hashed_password):
+        on_rehash(hash_password(password))
+    return valid
+
+
+def calibrate(target_ms: float, samples: int = 3) -> Dict[int, float]:
+    """
+    Times one hash per work factor, from MIN_ROUNDS upwards, until a
+    hash exceeds target_ms.
+
+    Returns:
+        dict: Mean milliseconds per hash keyed by rounds.
+    """
+    timings = {}
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        for _ in range(samples):
+            hashpw(b"calibration", salt)
+        timings[rounds] = (time.perf_counter() - start) * 1000 / samples
+        if timings[rounds] > target_ms:
+            break
+    return timings
+
+
+def recommend_rounds(timings: Dict[int, float], target_ms: float) -> int:
+    """
+    Picks the highest work factor whose hash fits in target_ms.
+    """
+    fitting = [r for r, ms in timings.items() if ms <= target_ms]
+    return max(fitting) if fitting else MIN_ROUNDS
+
+
+class HashingService:
+    """
+    Runs hash_password/is_valid on a bounded thread pool.
+
+    bcrypt releases the GIL while hashing, so throughput scales with the
+    number of workers up to the core count. At most max_in_flight calls
+    are queued or running; further submissions wait for a free slot.
+    """
+
+    def __init__(self, max_workers: int = None, max_in_flight: int = None):
+        """
+        Args:
+            max_workers (int): Hashing threads, defaults to the CPU count.
+            max_in_flight (int): Backpressure limit, defaults to
+            four times max_workers.
+        """
+        workers = max_workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(
+            workers, thread_name_prefix="bcrypt"
+        )
+        self._waiter = ThreadPoolExecutor(1, thread_name_prefix="bcrypt-wait")
+        self._slots = threading.BoundedSemaphore(max_in_flight or 4 * workers)
+
+    def submit_hash(self, password: str) -> Future:
+        """
+        Schedules hash_password, blocking while the service is full.
+
+        Returns:
+            Future: Resolves to the hashed password.
+        """
+        self._slots.acquire()
+        return self._submit(hash_password, password)
+
+    def submit_check(
+        self,
+        hashed_password: bytes,
+        password: str,
+        on_rehash: Callable[[bytes], None] = None,
+    ) -> Future:
+        """
+        Schedules is_valid, blocking while the service is full.
+
+        Returns:
+            Future: Resolves to True if the password matches.
+        """
+        self._slots.acquire()
+        return self._submit(is_valid, hashed_password, password, on_rehash)
+
+    async def hash_password(self, password: str) -> bytes:
+        """
+        Awaitable hash_password; waits for a slot without blocking
+        the event loop.
+        """
+        await self._acquire_async()
+        return await asyncio.wrap_future(self._submit(hash_password, password))
+
+    async def is_valid(
+        self,
+        hashed_password: bytes,
+        password: str,
+        on_rehash: Callable[[bytes], None] = None,
+    ) -> bool:
+        """
+        Awaitable is_valid; waits for a slot without blocking
+        the event loop. on_rehash runs on the worker thread.
+        """
+        await self._acquire_async()
+        future = self._submit(is_valid, hashed_password, password, on_rehash)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the worker threads once queued work is done.
+        """
+        self._waiter.shutdown(wait)
+        self._executor.shutdown(wait)
+
+    def __enter__(self) -> "HashingService":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+    def _submit(self, fn: Callable, *args: Any) -> Future:
+        """
+        Submits fn for a caller already holding a slot; the slot is
+        released when fn finishes.
+        """
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def _acquire_async(self) -> None:
+        """
+        Takes a slot, parking the wait on a helper thread if none is free.
+        """
+        if self._slots.acquire(blocking=False):
+            return
+        pending = self._waiter.submit(self._slots.acquire)
+        try:
+            await asyncio.wrap_future(pending)
+        except asyncio.CancelledError:
+            # A wait that already started still takes a slot: give it back
+            pending.add_done_callback(
+                lambda f: f.cancelled() or self._slots.release()
+            )
+            raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recommend a bcrypt work factor for this host."
+    )
+    parser.add_argument("command", choices=["calibrate"])
+    parser.add_argument("--target-ms", type=float, default=250.0,
+                        help="latency budget for one hash")
+    args = parser.parse_args()
+    timings = calibrate(args.target_ms)
+    print("{:>6} {:>10} {:>10}".format("rounds", "ms/hash", "hashes/s"))
+    for rounds, ms in timings.items():
+        print("{:>6} {:>10.1f} {:>10.1f}".format(rounds, ms, 1000 / ms))
+    best = recommend_rounds(timings, args.target_ms)
+    print("PERSONAL_DATA_BCRYPT_ROUNDS={}".format(best))
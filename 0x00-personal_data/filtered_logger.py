@@ -4,8 +4,16 @@
 import os
 import re
 import logging
+import argparse
+import queue
+import threading
 import mysql.connector
-from typing import List
+import multiprocessing
+import logging.handlers
+from collections import deque
+from db_pool import ConnectionPool
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
 
 
 # Constants and patterns used for redacting sensitive information
@@ -14,14 +22,106 @@ patterns = {
     "replace": lambda x: r"\g<field>={}".format(x),
 }
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
+ENGINE_CACHE_SIZE = 128
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+BATCH_SIZE = 1000
+CHUNK_SIZE = 500
+QUEUE_SIZE = 10000
+FLUSH_BATCH_SIZE = 256
+POLICIES = ("drop", "block")
+
+
+class RedactionEngine:
+    """Redacts a fixed set of fields with a pattern compiled once."""
+
+    def __init__(
+        self, fields: Sequence[str], redaction: str, separator: str
+    ):
+        extract, replace = patterns["extract"], patterns["replace"]
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self._pattern = re.compile(extract(self.fields, separator))
+        self._replacement = replace(redaction)
+
+    def redact(self, message: str) -> str:
+        """Obfuscates the engine's fields in a log message."""
+        return self._pattern.sub(self._replacement, message)
+
+
+class TokenizingRedactionEngine(RedactionEngine):
+    """Redacts by splitting once on the separator and looking keys up.
+
+    Output is identical to RedactionEngine for a single-character
+    separator and literal field names, but the cost is linear in the
+    message length instead of growing with fields x pairs.
+    """
+
+    def __init__(
+        self, fields: Sequence[str], redaction: str, separator: str
+    ):
+        if len(separator) != 1:
+            raise ValueError("separator must be a single character")
+        for field in fields:
+            if "=" in field or separator in field \
+                    or REGEX_METACHARACTERS.intersection(field):
+                raise ValueError("field {!r} is not literal".format(field))
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        # An empty alternation matches any "=", so mirror that here
+        self._keys = frozenset(self.fields) or frozenset(("",))
+        self._lengths = sorted({len(k) for k in self._keys}, reverse=True)
+
+    def redact(self, message: str) -> str:
+        """Obfuscates the engine's fields in a log message."""
+        keys, lengths = self._keys, self._lengths
+        redacted = "=" + self.redaction
+        parts = message.split(self.separator)
+        for i, part in enumerate(parts):
+            eq = part.find("=")
+            while eq != -1:
+                # Longest key ending at this "=" is the leftmost match
+                for size in lengths:
+                    if size <= eq and part[eq - size:eq] in keys:
+                        break
+                else:
+                    eq = part.find("=", eq + 1)
+                    continue
+                parts[i] = part[:eq] + redacted
+                break
+        return self.separator.join(parts)
+
+
+ENGINES = {
+    "regex": RedactionEngine,
+    "tokenize": TokenizingRedactionEngine,
+}
+
+
+@lru_cache(maxsize=ENGINE_CACHE_SIZE)
+def _cached_engine(
+    fields: Tuple[str, ...], redaction: str, separator: str, mode: str
+) -> RedactionEngine:
+    """Builds the engine for a hashable set of settings."""
+    return ENGINES[mode](fields, redaction, separator)
+
+
+def get_engine(
+    fields: Sequence[str], redaction: str, separator: str,
+    mode: str = "regex"
+) -> RedactionEngine:
+    """Returns the cached redaction engine for the given settings."""
+    if mode not in ENGINES:
+        raise ValueError("unknown redaction mode: {}".format(mode))
+    return _cached_engine(tuple(fields), redaction, separator, mode)
 
 
 def filter_datum(
     fields: List[str], redaction: str, message: str, separator: str
 ) -> str:
     """Obfuscates specified fields in a log message."""
-    extract, replace = patterns["extract"], patterns["replace"]
-    return re.sub(extract(fields, separator), replace(redaction), message)
+    return get_engine(fields, redaction, separator).redact(message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -32,24 +132,174 @@ class RedactingFormatter(logging.Formatter):
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], mode: str = "regex"):
         super().__init__(self.FORMAT)
         self.fields = fields
+        self.mode = mode
+        self._engine = get_engine(
+            fields, self.REDACTION, self.SEPARATOR, mode
+        )
 
     def format(self, record: logging.LogRecord) -> str:
         """Formats and redacts sensitive fields in a log record."""
-        msg = super().format(record)
-        return filter_datum(self.fields, self.REDACTION, msg, self.SEPARATOR)
-
-
-def get_logger() -> logging.Logger:
-    """Creates and configures a logger for user data."""
-    logger = logging.getLogger("user_data")
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
-    logger.setLevel(logging.INFO)
-    logger.propagate = False
-    logger.addHandler(stream_handler)
+        return self._engine.redact(super().format(record))
+
+
+class BatchingQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for a background thread that formats, redacts
+    and writes them to a stream handler, flushing once per batch."""
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        target: logging.StreamHandler,
+        maxsize: int = QUEUE_SIZE,
+        policy: str = "drop",
+        batch_size: int = FLUSH_BATCH_SIZE,
+        timeout: float = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError("policy must be 'drop' or 'block'")
+        super().__init__(queue.Queue(maxsize))
+        self.target = target
+        self.policy = policy
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._counter_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._drain, name="user_data-writer", daemon=True
+        )
+        self._thread.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Leaves formatting and redaction to the writer thread."""
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queues a record, dropping or blocking when the queue is full."""
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+        else:
+            with self._counter_lock:
+                self.queued += 1
+
+    def stats(self) -> dict:
+        """Returns the queued/dropped/written/failed counters."""
+        return {
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "pending": self.queue.qsize(),
+        }
+
+    def _drain(self) -> None:
+        """Writer loop: takes whatever is queued, up to batch_size."""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._STOP in batch
+            try:
+                self._write([r for r in batch if r is not self._STOP])
+            except Exception:
+                # A broken stream must not kill the writer: later
+                # records would be dropped, or block callers forever
+                with self._counter_lock:
+                    self.failed += len(batch) - stop
+            if stop:
+                return
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        """Formats a batch of records and flushes the target once;
+        write and flush errors go to the target's handleError."""
+        target = self.target
+        written = failed = 0
+        target.acquire()
+        try:
+            for record in records:
+                try:
+                    target.stream.write(
+                        target.format(record) + target.terminator
+                    )
+                    written += 1
+                except Exception:
+                    failed += 1
+                    target.handleError(record)
+            if records:
+                try:
+                    target.flush()
+                except Exception:
+                    target.handleError(records[-1])
+        finally:
+            target.release()
+        with self._counter_lock:
+            self.written += written
+            self.failed += failed
+
+    def close(self) -> None:
+        """Drains the queue, stops the writer and closes the target."""
+        if self._thread.is_alive():
+            self.queue.put(self._STOP)
+            self._thread.join()
+        self.target.close()
+        super().close()
+
+
+_handlers: Dict[tuple, logging.Handler] = {}
+_handlers_lock = threading.Lock()
+
+
+def get_logger(
+    name: str = "user_data",
+    fields: Sequence[str] = PII_FIELDS,
+    asynchronous: bool = False,
+    queue_size: int = QUEUE_SIZE,
+    policy: str = "drop",
+) -> logging.Logger:
+    """Creates and configures a logger for user data.
+
+    Calling it again with the same name and configuration reuses the
+    handler already attached; different fields, asynchronous, queue_size
+    or policy replace it. With asynchronous=True, formatting, redaction
+    and writes happen on a background thread behind a bounded queue.
+    Raises ValueError for a policy other than 'drop' or 'block'.
+    """
+    if policy not in POLICIES:
+        raise ValueError("policy must be 'drop' or 'block'")
+    key = (name, tuple(fields), asynchronous, queue_size, policy)
+    logger = logging.getLogger(name)
+    with _handlers_lock:
+        handler = _handlers.get(key)
+        if handler is not None and handler in logger.handlers:
+            return logger
+        for other in [k for k in _handlers if k[0] == name]:
+            stale = _handlers.pop(other)
+            logger.removeHandler(stale)
+            stale.close()
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(RedactingFormatter(fields))
+        handler = stream_handler
+        if asynchronous:
+            handler = BatchingQueueHandler(stream_handler, queue_size, policy)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        _handlers[key] = handler
     return logger
 
 
@@ -59,34 +309,157 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     db_name = os.getenv("PERSONAL_DATA_DB_NAME", "")
     db_user = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
     db_pwd = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
+    db_port = int(os.getenv("PERSONAL_DATA_DB_PORT", "3306"))
     return mysql.connector.connect(
         host=db_host,
-        port=3306,
+        port=db_port,
         user=db_user,
         password=db_pwd,
         database=db_name,
     )
 
 
-def main():
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the process-wide pool of get_db connections, sized by
+    PERSONAL_DATA_DB_POOL_SIZE and PERSONAL_DATA_DB_POOL_MAX_IDLE."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                get_db,
+                size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "5")),
+                max_idle=float(
+                    os.getenv("PERSONAL_DATA_DB_POOL_MAX_IDLE", "300")
+                ),
+            )
+        return _pool
+
+
+def iter_rows(
+    connection: mysql.connector.connection.MySQLConnection,
+    query: str,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[tuple]:
+    """Streams query results through an unbuffered cursor, one batch
+    of rows in memory at a time."""
+    with connection.cursor(buffered=False) as cursor:
+        cursor.execute(query)
+        rows = cursor.fetchmany(batch_size)
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany(batch_size)
+
+
+def iter_messages(
+    rows: Iterable[tuple], columns: Sequence[str]
+) -> Iterator[str]:
+    """Turns rows into `column=value;` log messages."""
+    for row in rows:
+        record = map(lambda x: f"{x[0]}={x[1]}", zip(columns, row))
+        yield "; ".join(record) + ";"
+
+
+def iter_log_records(messages: Iterable[str]) -> Iterator[logging.LogRecord]:
+    """Wraps messages into records for the user_data logger."""
+    for msg in messages:
+        yield logging.LogRecord(
+            "user_data", logging.INFO, None, None, msg, None, None
+        )
+
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Groups an iterable into lists of at most size items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_worker_formatter = None
+
+
+def _init_worker(fields: Sequence[str], mode: str = "regex") -> None:
+    """Builds the per-process formatter used by _redact_chunk."""
+    global _worker_formatter
+    _worker_formatter = RedactingFormatter(fields, mode)
+
+
+def _redact_chunk(columns: Sequence[str], rows: List[tuple]) -> str:
+    """Formats and redacts a chunk of rows inside a worker process."""
+    records = iter_log_records(iter_messages(rows, columns))
+    return "\n".join(_worker_formatter.format(r) for r in records)
+
+
+def export_parallel(
+    rows: Iterable[tuple],
+    columns: Sequence[str],
+    logger: logging.Logger,
+    workers: int,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """Redacts rows across a process pool and writes them, in order,
+    to the stream of the logger's first handler, with the fields and
+    mode of that handler's formatter."""
+    handler = logger.handlers[0]
+    handler = getattr(handler, "target", handler)
+    formatter = handler.formatter
+    window = deque()
+    with multiprocessing.Pool(
+        workers, _init_worker, (formatter.fields, formatter.mode)
+    ) as pool:
+        # A bounded window of chunks keeps memory flat, unlike imap
+        for chunk in _chunked(rows, chunk_size):
+            window.append(pool.apply_async(_redact_chunk, (columns, chunk)))
+            if len(window) >= workers * 2:
+                _write_chunk(handler, window.popleft().get())
+        while window:
+            _write_chunk(handler, window.popleft().get())
+
+
+def _write_chunk(handler: logging.StreamHandler, text: str) -> None:
+    """Writes pre-formatted lines to a stream handler."""
+    handler.acquire()
+    try:
+        handler.stream.write(text + handler.terminator)
+        handler.flush()
+    finally:
+        handler.release()
+
+
+def main(batch_size: int = None, workers: int = 1,
+         chunk_size: int = CHUNK_SIZE):
     """Logs user records from the database."""
     fields = "name,email,phone,ssn,password,ip,last_login,user_agent"
     columns = fields.split(",")
     query = f"SELECT {fields} FROM users;"
+    if batch_size is None:
+        batch_size = int(os.getenv("PERSONAL_DATA_BATCH_SIZE", BATCH_SIZE))
     info_logger = get_logger()
-    connection = get_db()
 
-    with connection.cursor() as cursor:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        for row in rows:
-            record = map(lambda x: f"{x[0]}={x[1]}", zip(columns, row))
-            msg = "; ".join(list(record)) + ";"
-            log_record = logging.LogRecord(
-                "user_data", logging.INFO, None, None, msg, None, None
-            )
+    with get_pool().connection() as connection:
+        rows = iter_rows(connection, query, batch_size)
+        if workers > 1:
+            export_parallel(rows, columns, info_logger, workers, chunk_size)
+            return
+        for log_record in iter_log_records(iter_messages(rows, columns)):
             info_logger.handle(log_record)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="rows fetched per round trip")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="redaction processes (1 disables the pool)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="rows handed to a worker at a time")
+    args = parser.parse_args()
+    main(args.batch_size, args.workers, args.chunk_size)
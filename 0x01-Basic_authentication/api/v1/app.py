@@ -1,82 +1,236 @@
 #!/usr/bin/env python3
 """
 API entry point module.
-Sets up the application, registers routes, handles authentication, 
-and defines error handlers.
+Builds the application in create_app(): registers routes, sets up
+authentication and error handlers, and loads the user store. Heavy
+imports (views, models, auth backends, CORS) happen inside the factory,
+each timed as a startup phase.
 """
+from contextlib import contextmanager
 from os import getenv
-from api.v1.views import app_views
+from api.v1 import metrics
+from api.v1.auth.auth import PathMatcher
 from flask import Flask, jsonify, abort, request
-from flask_cors import CORS
-import os
-
-# Initialize Flask application
-app = Flask(__name__)
-
-# Register blueprints for routing
-app.register_blueprint(app_views)
-
-# Enable CORS for all routes starting with '/api/v1/*'
-CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
+from typing import Iterator, List, Tuple
+import sys
+import threading
+import time
+
+# Routes that do not require authentication
+EXCLUDED_ROUTES = (
+    "/api/v1/status/",
+    "/api/v1/unauthorized/",
+    "/api/v1/forbidden/",
+    "/api/v1/metrics/",
+)
+_default_app_lock = threading.Lock()
+
+
+class StartupPhases:
+    """
+    Wall time of each create_app phase.
+    """
 
-# Authentication setup based on environment variable
-auth = None
-AUTH_TYPE = os.getenv("AUTH_TYPE")
+    def __init__(self):
+        """
+        Initializes an empty breakdown.
+        """
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Times the enclosed block as one phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def total(self) -> float:
+        """
+        Returns the time of all phases, in seconds.
+        """
+        return sum(seconds for _, seconds in self.phases)
+
+    def report(self) -> str:
+        """
+        Returns the breakdown in the layout of python -X importtime.
+        """
+        lines = ["startup: self [us] | cumulative | phase"]
+        cumulative = 0.0
+        for name, seconds in self.phases:
+            cumulative += seconds
+            lines.append("startup: {:>9.0f} | {:>10.0f} | {}".format(
+                seconds * 1e6, cumulative * 1e6, name))
+        return "\n".join(lines)
+
+
+def _make_auth(auth_type: str):
+    """
+    Imports and instantiates the auth backend named by auth_type.
 
-if AUTH_TYPE == "auth":
-    from api.v1.auth.auth import Auth
+    Returns:
+        The Auth instance, or None when authentication is disabled.
+    """
+    if auth_type == "auth":
+        from api.v1.auth.auth import Auth
 
-    auth = Auth()
-elif AUTH_TYPE == "basic_auth":
-    from api.v1.auth.basic_auth import BasicAuth
+        return Auth()
+    if auth_type == "basic_auth":
+        from api.v1.auth.basic_auth import BasicAuth
 
-    auth = BasicAuth()
+        return BasicAuth()
+    return None
 
 
-@app.before_request
-def before_request_handler():
-    """
-    Process each request before it reaches the route handler.
-    If authentication is enabled, check for valid authorization headers.
-    """
-    if auth is not None:
-        # List of routes that do not require authentication
-        excluded_routes = [
-            "/api/v1/status/",
-            "/api/v1/unauthorized/",
-            "/api/v1/forbidden/",
-        ]
-
-        # Check if the current route requires authentication
-        if auth.require_auth(request.path, excluded_routes):
-            # Abort with a 401 error if the Authorization header is missing
-            if auth.authorization_header(request) is None:
-                abort(401, description="Unauthorized")
-            # Abort with a 403 error if the user is not authenticated
-            if auth.current_user(request) is None:
-                abort(403, description="Forbidden")
-
-
-@app.errorhandler(404)
 def not_found(error) -> str:
     """Handle 404 errors (Not Found)."""
     return jsonify({"error": "Not found"}), 404
 
 
-@app.errorhandler(401)
 def unauthorized(error) -> str:
     """Handle 401 errors (Unauthorized)."""
     return jsonify({"error": "Unauthorized"}), 401
 
 
-@app.errorhandler(403)
 def forbidden(error) -> str:
     """Handle 403 errors (Forbidden)."""
     return jsonify({"error": "Forbidden"}), 403
 
 
+def create_app(config: dict = None) -> Flask:
+    """
+    Builds the API application.
+
+    Args:
+        config (dict): Overrides of the defaults:
+            - AUTH_TYPE: "auth", "basic_auth" or None (env AUTH_TYPE)
+            - EXCLUDED_ROUTES: paths that skip authentication
+            - LOAD_STORE: load the user store from disk, and apply the
+              writes of other processes before each request (True)
+            - STARTUP_BUDGET_MS: log a warning with the phase breakdown
+              above this startup time (env API_STARTUP_BUDGET_MS)
+            - STARTUP_REPORT: print the breakdown to stderr (env
+              API_STARTUP_REPORT=1)
+
+    Returns:
+        Flask: The application; its startup phases are in
+        app.config["STARTUP_PHASES"] and its auth backend in
+        app.extensions["auth"].
+    """
+    startup = StartupPhases()
+    with startup.phase("flask"):
+        app = Flask(__name__)
+        budget = getenv("API_STARTUP_BUDGET_MS")
+        app.config.update(
+            AUTH_TYPE=getenv("AUTH_TYPE"),
+            EXCLUDED_ROUTES=EXCLUDED_ROUTES,
+            LOAD_STORE=True,
+            STARTUP_BUDGET_MS=float(budget) if budget else None,
+            STARTUP_REPORT=getenv("API_STARTUP_REPORT") == "1",
+        )
+        app.config.update(config or {})
+
+    with startup.phase("views"):
+        from api.v1.views import app_views
+
+        # Register blueprints for routing
+        app.register_blueprint(app_views)
+
+    with startup.phase("cors"):
+        from flask_cors import CORS
+
+        # Enable CORS for all routes starting with '/api/v1/*'
+        CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
+
+    with startup.phase("auth"):
+        auth = _make_auth(app.config["AUTH_TYPE"])
+        app.extensions["auth"] = auth
+        # Compiled once per application
+        excluded = PathMatcher(app.config["EXCLUDED_ROUTES"])
+
+    with startup.phase("store"):
+        refresh = None
+        if app.config["LOAD_STORE"]:
+            from models.user import User
+
+            User.load_from_file()
+            refresh = User.refresh
+
+    with startup.phase("hooks"):
+        @app.before_request
+        def before_request_handler():
+            """
+            Process each request before it reaches the route handler.
+            If authentication is enabled, check for valid authorization
+            headers.
+            """
+            metrics.start_request(request)
+            request.current_user = None
+            if refresh is not None:
+                # Apply the writes made through other workers
+                refresh()
+            if auth is not None:
+                # Check if the current route requires authentication
+                start = metrics.clock()
+                required = auth.require_auth(request.path, excluded)
+                metrics.stage("require_auth", start)
+                if required:
+                    result = auth.authenticate(request)
+                    # Abort with a 401 error if the Authorization header
+                    # is missing
+                    if result.header is None:
+                        abort(401, description="Unauthorized")
+                    # Abort with a 403 error if the user is not
+                    # authenticated
+                    if result.user is None:
+                        abort(403, description="Forbidden")
+                    # Views read the user from here instead of
+                    # re-authenticating
+                    request.current_user = result.user
+            metrics.view_started(request)
+
+        @app.after_request
+        def after_request_handler(response):
+            """
+            Record the request latency per route and status code.
+            """
+            return metrics.finish_request(request, response)
+
+        app.register_error_handler(404, not_found)
+        app.register_error_handler(401, unauthorized)
+        app.register_error_handler(403, forbidden)
+
+    app.config["STARTUP_PHASES"] = startup.phases
+    if app.config["STARTUP_REPORT"]:
+        print(startup.report(), file=sys.stderr)
+    budget = app.config["STARTUP_BUDGET_MS"]
+    if budget is not None and startup.total() * 1e3 > budget:
+        app.logger.warning("startup took %.1f ms, over the %.1f ms "
+                           "budget:\n%s", startup.total() * 1e3, budget,
+                           startup.report())
+    return app
+
+
+def __getattr__(name: str):
+    """
+    Builds the default application on first access to app or auth, so
+    importing this module stays cheap.
+    """
+    if name in ("app", "auth"):
+        with _default_app_lock:
+            if "app" not in globals():
+                globals()["app"] = create_app()
+        app = globals()["app"]
+        return app if name == "app" else app.extensions["auth"]
+    raise AttributeError("module {!r} has no attribute {!r}"
+                         .format(__name__, name))
+
+
 if __name__ == "__main__":
     # Get host and port from environment variables or use default values
     host = getenv("API_HOST", "0.0.0.0")
-    port = getenv("API_PORT", "5000")
-    app.run(host=host, port=port)
+    port = int(getenv("API_PORT", "5000"))
+    create_app().run(host=host, port=port)
@@ -3,42 +3,123 @@
 Definition of class Auth
 """
 from flask import request
+from functools import lru_cache
 from typing import (
+    Iterable,
     List,
-    TypeVar
+    Tuple,
+    TypeVar,
+    Union
 )
 
+_EXACT = object()
+_WILDCARD = object()
+
+
+class PathMatcher:
+    """
+    Excluded paths compiled into a character trie
+
+    An entry matches the same path with or without a trailing slash;
+    an entry ending with * matches every path that starts with the
+    text before the *. Matching costs O(len(path)) whatever the number
+    of entries.
+    """
+    def __init__(self, paths: Iterable[str]):
+        """
+        Args:
+            - paths(Iterable[str]): Excluded paths, optionally ending
+              with * or /
+        """
+        self.paths = tuple(paths)
+        self._root = {}
+        for entry in self.paths:
+            marker = _EXACT
+            if entry.endswith("*"):
+                entry, marker = entry[:-1], _WILDCARD
+            elif entry.endswith("/"):
+                entry = entry[:-1]
+            node = self._root
+            for ch in entry:
+                node = node.setdefault(ch, {})
+            node[marker] = True
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def matches(self, path: str) -> bool:
+        """
+        True if path is covered by one of the entries
+        """
+        node = self._root
+        last = len(path) - 1
+        for i, ch in enumerate(path):
+            if _WILDCARD in node:
+                return True
+            if i == last and ch == "/" and _EXACT in node:
+                return True
+            node = node.get(ch)
+            if node is None:
+                return False
+        if _EXACT in node or _WILDCARD in node:
+            return True
+        # "/users" is covered by "/users/*", as "/users/" would be
+        return _WILDCARD in node.get("/", ())
+
+
+@lru_cache(maxsize=32)
+def compile_paths(paths: Tuple[str, ...]) -> PathMatcher:
+    """
+    Cached PathMatcher for callers still passing plain lists
+    """
+    return PathMatcher(paths)
+
+
+class AuthResult:
+    """
+    Outcome of authenticating one request
+    """
+    def __init__(self, header: str = None, user: TypeVar('User') = None):
+        """
+        Args:
+            - header(str): The Authorization header, None if missing
+            - user(User): The authenticated user, None if not resolved
+        """
+        self.header = header
+        self.user = user
+
+    @property
+    def authenticated(self) -> bool:
+        """
+        True if a user was resolved from the request
+        """
+        return self.user is not None
+
 
 class Auth:
     """
     Manages the API authentication
     """
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(
+        self, path: str, excluded_paths: Union[List[str], PathMatcher]
+    ) -> bool:
         """
         Determines whether a given path requires authentication or not
         Args:
             - path(str): Url path to be checked
-            - excluded_paths(List of str): List of paths that do not require
-              authentication
+            - excluded_paths(List of str or PathMatcher): Paths that do
+              not require authentication; pass a PathMatcher built once
+              to avoid compiling the list on every call
         Return:
             - True if path is not in excluded_paths, else False
         """
         if path is None:
             return True
-        elif excluded_paths is None or excluded_paths == []:
+        elif excluded_paths is None or len(excluded_paths) == 0:
             return True
-        elif path in excluded_paths:
-            return False
-        else:
-            for i in excluded_paths:
-                if i.startswith(path):
-                    return False
-                if path.startswith(i):
-                    return False
-                if i[-1] == "*":
-                    if path.startswith(i[:-1]):
-                        return False
-        return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = compile_paths(tuple(excluded_paths))
+        return not excluded_paths.matches(path)
 
     def authorization_header(self, request=None) -> str:
         """
@@ -55,4 +136,20 @@ class Auth:
         """
         Returns a User instance from information from a request object
         """
+        return self.user_from_header(self.authorization_header(request))
+
+    def user_from_header(self, header: str) -> TypeVar('User'):
+        """
+        Returns the User an Authorization header value identifies
+        """
         return None
+
+    def authenticate(self, request=None) -> AuthResult:
+        """
+        Authenticates a request once: reads the Authorization header and
+        resolves its user, so callers need not repeat either step
+        """
+        header = self.authorization_header(request)
+        if header is None:
+            return AuthResult()
+        return AuthResult(header, self.user_from_header(header))
@@ -3,14 +3,33 @@
 Defines the BasicAuth class for implementing Basic Authentication.
 """
 import base64
+import weakref
+from os import getenv
 from .auth import Auth
-from typing import TypeVar
+from .credential_cache import CredentialCache
+from api.v1 import metrics
+from typing import Optional, Tuple, TypeVar
 from models.user import User
 
 
 class BasicAuth(Auth):
     """Basic Authentication class implementing specific authentication methods."""
 
+    def __init__(self):
+        """
+        Sets up the verified-credential cache, sized by AUTH_CACHE_SIZE
+        and AUTH_CACHE_TTL, and ties it to User save/remove for as long
+        as this instance lives.
+        """
+        self.credential_cache = CredentialCache(
+            maxsize=int(getenv("AUTH_CACHE_SIZE", "1024")),
+            ttl=float(getenv("AUTH_CACHE_TTL", "60")),
+        )
+        listener = self.credential_cache.on_user_change
+        User.add_listener(listener)
+        # Apps built and dropped by create_app leave no listener behind
+        weakref.finalize(self, User.remove_listener, listener)
+
     def extract_base64_authorization_header(self, authorization_header: str) -> str:
         """
         Extracts the Base64 encoded part of the Authorization header.
@@ -88,38 +107,67 @@ class BasicAuth(Auth):
         Returns:
             User: The User object if authentication is successful, None otherwise.
         """
+        return self._verify_credentials(user_email, user_pwd)[0]
+
+    def _verify_credentials(
+        self, user_email: str, user_pwd: str
+    ) -> Tuple[Optional[TypeVar("User")], Optional[str]]:
+        """
+        Finds the user matching an email and password.
+
+        Returns:
+            (User, hash): The user and the stored hash the password was
+            checked against (the user may rehash it afterwards), or
+            (None, None).
+        """
         if user_email is None or not isinstance(user_email, str):
-            return None
+            return None, None
         if user_pwd is None or not isinstance(user_pwd, str):
-            return None
+            return None, None
         try:
+            start = metrics.clock()
             users = User.search({"email": user_email})
-            if not users:
-                return None
+            metrics.stage("search", start)
             for user in users:
-                if user.is_valid_password(user_pwd):
-                    return user
-            return None
+                checked = user.password
+                start = metrics.clock()
+                valid = user.is_valid_password(user_pwd)
+                metrics.stage("verify", start)
+                if valid:
+                    return user, checked
+            return None, None
         except Exception:
-            return None
+            return None, None
 
-    def current_user(self, request=None) -> TypeVar("User"):
+    def user_from_header(self, auth_header: str) -> TypeVar("User"):
         """
-        Retrieves the current authenticated user based on the request.
+        Retrieves the user identified by a Basic Authorization header.
 
         Args:
-            request: The Flask request object.
+            auth_header (str): The Authorization header value.
 
         Returns:
             User: The authenticated User object, or None if authentication fails.
         """
-        auth_header = self.authorization_header(request)
-        if auth_header:
-            token = self.extract_base64_authorization_header(auth_header)
-            if token:
-                decoded = self.decode_base64_authorization_header(token)
-                if decoded:
-                    email, password = self.extract_user_credentials(decoded)
-                    if email:
-                        return self.user_object_from_credentials(email, password)
-        return None
+        if not auth_header:
+            return None
+        user_id = self.credential_cache.get(auth_header)
+        if user_id is not None:
+            user = User.get(user_id)
+            if user is not None:
+                return user
+        start = metrics.clock()
+        token = self.extract_base64_authorization_header(auth_header)
+        decoded = self.decode_base64_authorization_header(token)
+        email, password = self.extract_user_credentials(decoded)
+        metrics.stage("decode", start)
+        if not email:
+            return None
+        user, checked = self._verify_credentials(email, password)
+        if user is not None:
+            self.credential_cache.put(auth_header, user.id, checked)
+            # A password change that landed before the put was notified
+            # too early to drop this entry
+            if user.password != checked:
+                self.credential_cache.invalidate(user.id, user.password)
+        return user
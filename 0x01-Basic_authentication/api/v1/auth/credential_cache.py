@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Definition of class CredentialCache
+"""
+from models.lru import DigestLRU
+from typing import Optional
+
+
+class CredentialCache(DigestLRU):
+    """
+    Bounded LRU, with a TTL, of verified Authorization headers
+
+    Headers are stored as an HMAC under a per-process random key, so
+    the cache never holds credentials in the clear.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        """
+        Args:
+            - maxsize(int): Entries kept before the least recent is evicted
+            - ttl(float): Seconds an entry stays valid
+        """
+        super().__init__(maxsize, ttl)
+        self._by_user = {}
+
+    def get(self, header: str) -> Optional[str]:
+        """
+        Returns the user id cached for a header, or None
+        """
+        entry = self.lookup(self.digest(header))
+        return None if entry is None else entry[0]
+
+    def put(self, header: str, user_id: str, password: str) -> None:
+        """
+        Caches a verified header for user_id; password is the stored
+        hash it was checked against
+        """
+        self.store(self.digest(header), (user_id, password))
+
+    def invalidate(self, user_id: str, password: str = None) -> None:
+        """
+        Drops the entries of a user; with password, only those checked
+        against a different stored hash
+        """
+        with self._lock:
+            for digest in list(self._by_user.get(user_id, ())):
+                stored = self._entries[digest][0][1]
+                if password is None or stored != password:
+                    self._drop(digest)
+
+    def on_user_change(self, event: str, user) -> None:
+        """
+        models listener: a removed user, or a saved user whose password
+        changed, loses its cached headers; a reloaded store, all of them
+        """
+        if event == "reload":
+            self.clear()
+        elif event == "remove":
+            self.invalidate(user.id)
+        else:
+            self.invalidate(user.id, user.password)
+
+    def _added(self, digest: bytes, value: tuple) -> None:
+        """
+        Indexes a new entry by user id
+        """
+        self._by_user.setdefault(value[0], set()).add(digest)
+
+    def _dropped(self, digest: bytes, value: tuple) -> None:
+        """
+        Removes a dropped entry from the user id index
+        """
+        digests = self._by_user.get(value[0])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[value[0]]
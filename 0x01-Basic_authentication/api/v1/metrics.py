@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Request and auth-stage latency metrics.
+Latencies go into log-linear (HDR-style) histograms: 8 sub-buckets per
+power of two nanoseconds, so any value is kept within 12.5%. They are
+exported in the Prometheus text format; API_METRICS=off disables
+recording.
+"""
+from os import getenv
+from typing import Dict, Iterator, List, Tuple
+import threading
+import time
+import weakref
+
+ENABLED = getenv("API_METRICS", "on") != "off"
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS
+# Prometheus "le" bounds, in seconds, exported from the finer buckets
+EXPORT_BOUNDS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+clock = time.perf_counter_ns
+
+
+def _bucket_max(index: int) -> int:
+    """
+    Largest value, in nanoseconds, that falls into a bucket.
+    """
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BITS) - 1
+    return ((SUB_BUCKETS + (index & (SUB_BUCKETS - 1)) + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    Log-linear latency histogram over nanosecond values.
+    Each thread records into its own histograms (see _shard), so
+    record() takes no lock; readers merge them.
+    """
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        """
+        Initializes an empty histogram covering up to 2**64 ns.
+        """
+        self.counts = [0] * (64 * SUB_BUCKETS)
+        self.total = 0
+
+    def record(self, ns: int) -> None:
+        """
+        Adds one value, in nanoseconds.
+        """
+        if ns < SUB_BUCKETS:
+            index = max(ns, 0)
+        else:
+            shift = ns.bit_length() - SUB_BITS - 1
+            index = ((shift + 1) << SUB_BITS) + (ns >> shift) - SUB_BUCKETS
+        self.counts[index] += 1
+        self.total += ns
+
+    def merge(self, other: 'Histogram') -> None:
+        """
+        Adds the values of another histogram.
+        """
+        counts = list(other.counts)
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.total += other.total
+
+    @property
+    def count(self) -> int:
+        """
+        Number of values recorded.
+        """
+        return sum(self.counts)
+
+    def percentile(self, pct: float) -> float:
+        """
+        Returns the pct-th percentile, in seconds (bucket upper bound).
+        """
+        rank = max(1, self.count * pct / 100)
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return _bucket_max(index) / 1e9
+        return 0.0
+
+
+def _export_indexes() -> List[int]:
+    """
+    Returns the last bucket index inside each export bound.
+    """
+    indexes = []
+    for bound in EXPORT_BOUNDS:
+        index = 0
+        while _bucket_max(index + 1) <= bound * 1e9:
+            index += 1
+        indexes.append(index)
+    return indexes
+
+
+_EXPORT_INDEXES = _export_indexes()
+# (requests, stages) histograms of every live thread that recorded;
+# request histograms are keyed by (method, route, status), stages by name
+_shards: List[Tuple[Dict[Tuple[str, str, int], Histogram],
+                    Dict[str, Histogram]]] = []
+# Totals of the shards of threads that have exited
+_retired: Tuple[dict, dict] = ({}, {})
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+class _ShardOwner:
+    """
+    Thread-local holder of a shard; it is dropped when its thread exits,
+    which retires the shard.
+    """
+
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard: Tuple[dict, dict]):
+        """
+        Wraps the histograms of the calling thread.
+        """
+        self.shard = shard
+
+
+def _merge_into(total: Tuple[dict, dict], shard: Tuple[dict, dict]) -> None:
+    """
+    Adds the histograms of shard into total.
+    """
+    for registry, merged in zip(shard, total):
+        for key, histogram in list(registry.items()):
+            merged.setdefault(key, Histogram()).merge(histogram)
+
+
+def _retire(shard: Tuple[dict, dict]) -> None:
+    """
+    Folds the shard of an exited thread into the retired totals, so
+    short-lived threads do not accumulate shards.
+    """
+    with _shards_lock:
+        _shards.remove(shard)
+        _merge_into(_retired, shard)
+
+
+def _shard() -> Tuple[dict, dict]:
+    """
+    Returns the histograms of the calling thread.
+    """
+    try:
+        return _local.owner.shard
+    except AttributeError:
+        shard = ({}, {})
+        with _shards_lock:
+            _shards.append(shard)
+        owner = _local.owner = _ShardOwner(shard)
+        weakref.finalize(owner, _retire, shard)
+        return shard
+
+
+def _record(registry: dict, key, ns: int) -> None:
+    """
+    Records ns into the histogram of key, creating it on first use.
+    """
+    histogram = registry.get(key)
+    if histogram is None:
+        histogram = registry[key] = Histogram()
+    histogram.record(ns)
+
+
+def histograms() -> Tuple[Dict[Tuple[str, str, int], Histogram],
+                          Dict[str, Histogram]]:
+    """
+    Returns the (requests, stages) histograms merged across threads.
+    """
+    merged = ({}, {})
+    # Under the lock so that a shard retiring meanwhile is counted once
+    with _shards_lock:
+        _merge_into(merged, _retired)
+        for shard in _shards:
+            _merge_into(merged, shard)
+    return merged
+
+
+def stage(name: str, start: int) -> None:
+    """
+    Records the time elapsed since start (a clock() value) for a stage:
+    require_auth, decode, search, verify, serialize or view.
+    """
+    if ENABLED:
+        _record(_shard()[1], name, clock() - start)
+
+
+def start_request(request) -> None:
+    """
+    Marks the start of a request.
+    """
+    if ENABLED:
+        request.metrics_start = clock()
+
+
+def view_started(request) -> None:
+    """
+    Marks the end of the before-request hooks.
+    """
+    if ENABLED:
+        request.metrics_view = clock()
+
+
+def finish_request(request, response):
+    """
+    Records the latency of a request per method, route and status, and
+    the view stage (view and serialisation) if it was reached.
+
+    Returns:
+        The response, unchanged.
+    """
+    start = getattr(request, "metrics_start", None)
+    if not ENABLED or start is None:
+        return response
+    now = clock()
+    requests, stages = _shard()
+    view = getattr(request, "metrics_view", None)
+    if view is not None:
+        _record(stages, "view", now - view)
+    rule = request.url_rule
+    key = (request.method, rule.rule if rule else "unmatched",
+           response.status_code)
+    _record(requests, key, now - start)
+    return response
+
+
+def _escape(value: str) -> str:
+    """
+    Escapes a Prometheus label value.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+def _series(name: str, labels: str, histogram: Histogram) -> Iterator[str]:
+    """
+    Yields the bucket, sum and count lines of one histogram.
+    """
+    counts, total = histogram.counts, histogram.total
+    count = sum(counts)
+    cumulative = 0
+    position = 0
+    for bound, last in zip(EXPORT_BOUNDS, _EXPORT_INDEXES):
+        cumulative += sum(counts[position:last + 1])
+        position = last + 1
+        yield '{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound,
+                                                  cumulative)
+    yield '{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, count)
+    yield '{}_sum{{{}}} {}'.format(name, labels, total / 1e9)
+    yield '{}_count{{{}}} {}'.format(name, labels, count)
+
+
+# (metric, type, help, stats key) of the cache series
+CACHE_SERIES = (
+    ("api_cache_hits_total", "counter", "Cache lookups that hit.", "hits"),
+    ("api_cache_misses_total", "counter", "Cache lookups that missed.",
+     "misses"),
+    ("api_cache_evictions_total", "counter",
+     "Entries evicted to stay within the size bound.", "evictions"),
+    ("api_cache_size", "gauge", "Entries currently cached.", "size"),
+)
+
+
+def _cache_lines(caches: Dict[str, dict]) -> Iterator[str]:
+    """
+    Yields the series of caches, given as name -> stats() dict.
+    """
+    for metric, kind, text, key in CACHE_SERIES:
+        yield "# HELP {} {}".format(metric, text)
+        yield "# TYPE {} {}".format(metric, kind)
+        for name, stats in sorted(caches.items()):
+            yield '{}{{cache="{}"}} {}'.format(metric, _escape(name),
+                                               stats.get(key, 0))
+
+
+def render(caches: Dict[str, dict] = None) -> str:
+    """
+    Returns every histogram in the Prometheus text format, followed by
+    the counters of caches (name -> stats() dict), if given.
+    """
+    requests, stages = histograms()
+    lines = [
+        "# HELP api_request_duration_seconds Request latency by route.",
+        "# TYPE api_request_duration_seconds histogram",
+    ]
+    for (method, route, status), histogram in sorted(requests.items()):
+        labels = 'method="{}",route="{}",status="{}"'.format(
+            method, _escape(route), status)
+        lines.extend(_series("api_request_duration_seconds", labels,
+                             histogram))
+    lines += [
+        "# HELP api_stage_duration_seconds Latency of auth and view stages.",
+        "# TYPE api_stage_duration_seconds histogram",
+    ]
+    for name, histogram in sorted(stages.items()):
+        labels = 'stage="{}"'.format(_escape(name))
+        lines.extend(_series("api_stage_duration_seconds", labels,
+                             histogram))
+    if caches:
+        lines.extend(_cache_lines(caches))
+    return "\n".join(lines) + "\n"
@@ -3,8 +3,16 @@
 Module containing API index views.
 Handles various endpoints for status checks and error testing.
 """
-from flask import jsonify, abort
+from flask import Response, abort, current_app, jsonify
+from api.v1 import metrics
 from api.v1.views import app_views
+from models import hashers
+from models.user import User
+
+# (collection version, payload) of the last stats response, replaced as
+# one tuple so concurrent requests never pair a version with another
+# version's payload
+_stats_cache = {"entry": (None, None)}
 
 
 @app_views.route("/unauthorized", methods=["GET"], strict_slashes=False)
@@ -48,11 +56,40 @@ def stats() -> str:
     """
     GET /api/v1/stats
     Retrieves the count of various objects in the system.
+    The payload is recomputed only after the store has changed.
 
     Returns:
-        - JSON response containing the count of users.
+        - JSON response containing the count of users, and per-model
+          counters (count, saves, removes, loads, last_write,
+          disk_bytes).
+    """
+    version, payload = _stats_cache["entry"]
+    if version != User.collection_version():
+        version, user_stats = User.versioned_stats()
+        payload = {
+            "users": user_stats["count"],
+            "models": {"User": user_stats},
+        }
+        _stats_cache["entry"] = (version, payload)
+    return jsonify(payload)
+
+
+@app_views.route("/metrics", methods=["GET"], strict_slashes=False)
+def metrics_view() -> str:
     """
-    from models.user import User
+    GET /api/v1/metrics
+    Exposes request and auth-stage latency histograms, and the
+    counters of the password verification and credential caches.
 
-    stats = {"users": User.count()}
-    return jsonify(stats)
+    Returns:
+        - Prometheus text format, or 404 if API_METRICS is off.
+    """
+    if not metrics.ENABLED:
+        abort(404)
+    caches = {"verification": hashers.verification_cache.stats()}
+    credential_cache = getattr(current_app.extensions.get("auth"),
+                               "credential_cache", None)
+    if credential_cache is not None:
+        caches["credential"] = credential_cache.stats()
+    return Response(metrics.render(caches),
+                    mimetype="text/plain; version=0.0.4")
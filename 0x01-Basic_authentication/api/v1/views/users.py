@@ -1,19 +1,169 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+from api.v1.json_response import BACKEND, dumps, json_response
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response, abort, jsonify, request
+from datetime import datetime
+from models import hashers
+from models.base import MissingObjects
 from models.user import User
+from os import getenv
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlencode
+import hashlib
+import json
+import os
+
+MAX_PAGE_SIZE = int(getenv("API_MAX_PAGE_SIZE", "1000"))
+MAX_BATCH_SIZE = int(getenv("API_MAX_BATCH_SIZE", "100000"))
+HASH_WORKERS = int(getenv("API_HASH_WORKERS", str(os.cpu_count() or 1)))
+STREAM_CHUNK = 500
+STREAM_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _fields() -> Optional[Tuple[str, ...]]:
+    """ Attributes requested by the fields query parameter, if any
+    """
+    fields = request.args.get("fields")
+    if fields is None:
+        return None
+    return tuple(name.strip() for name in fields.split(","))
+
+
+def _etag(version: str) -> str:
+    """ Entity tag of a resource version as requested: the query (e.g.
+    fields) and the encoder change the representation
+    """
+    key = "|".join((version, request.query_string.decode(), BACKEND))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def _settled(last_modified: Optional[datetime]) -> bool:
+    """ True if last_modified lies in a past second: HTTP dates have a
+    one-second resolution, so a later write in the current second would
+    carry the same date
+    """
+    return last_modified is not None and \
+        last_modified.replace(microsecond=0) \
+        < datetime.utcnow().replace(microsecond=0)
+
+
+def _with_validators(response: Response, etag: str,
+                     last_modified: Optional[datetime]) -> Response:
+    """ Set the ETag and Last-Modified headers of a response; the
+    latter only once its second is over, so a client can never hold a
+    date that a later write shares
+    """
+    response.set_etag(etag)
+    if _settled(last_modified):
+        response.last_modified = last_modified
+    return response
+
+
+def _not_modified(etag: str,
+                  last_modified: Optional[datetime]) -> Optional[Response]:
+    """ 304 response if the client's copy is current, else None;
+    If-None-Match takes precedence over If-Modified-Since, which is not
+    trusted while the last change is in the current second
+    """
+    if request.if_none_match:
+        current = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        current = since is not None and _settled(last_modified) \
+            and last_modified.replace(microsecond=0) \
+            <= since.replace(tzinfo=None)
+    if not current:
+        return None
+    return _with_validators(Response(status=304), etag, last_modified)
+
+
+def _stream_users(users: Iterable[User], mode: str,
+                  fields: Tuple[str, ...] = None) -> Iterator[str]:
+    """ Encode users a chunk at a time, as one JSON array or as NDJSON
+    """
+    def encode(batch):
+        if mode == "json":
+            return dumps(batch)[1:-1]
+        return "\n".join(dumps(obj) for obj in batch)
+
+    head, sep, tail = ("[", ",", "]\n") if mode == "json" \
+        else ("", "\n", "\n")
+    yield head
+    batch = []
+    lead = ""
+    for user in users:
+        batch.append(user.to_json(fields=fields))
+        if len(batch) == STREAM_CHUNK:
+            yield lead + encode(batch)
+            batch = []
+            lead = sep
+    if batch:
+        yield lead + encode(batch)
+        lead = sep
+    if lead or mode == "json":
+        yield tail
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (all optional):
+      - limit: page size, 1 to API_MAX_PAGE_SIZE, in id order
+      - cursor: X-Next-Cursor of the previous page
+      - stream: "json" (array) or "ndjson", encoded incrementally
+      - fields: comma-separated attributes to return, e.g. id,email
     Return:
-      - list of all User objects JSON represented
+      - list of User objects JSON represented; without limit, all of
+        them; the next page is given by X-Next-Cursor and Link headers
+      - 304 if If-None-Match/If-Modified-Since match the collection
+      - 400 if limit or stream is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+    mode = request.args.get("stream")
+    fields = _fields()
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            return jsonify({'error': "limit must be between 1 and {}"
+                            .format(MAX_PAGE_SIZE)}), 400
+    if mode is not None and mode not in STREAM_TYPES:
+        return jsonify({'error': "stream must be json or ndjson"}), 400
+
+    etag = _etag(User.collection_version())
+    last_modified = User.last_modified()
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    if mode is not None:
+        users = User.iter_ordered(cursor, limit, STREAM_CHUNK)
+        response = Response(_stream_users(users, mode, fields),
+                            mimetype=STREAM_TYPES[mode])
+        return _with_validators(response, etag, last_modified)
+    if limit is None and cursor is None:
+        all_users = [user.to_json(fields=fields) for user in User.all()]
+        return _with_validators(json_response(all_users), etag,
+                                last_modified)
+    users, next_cursor = User.page(limit or MAX_PAGE_SIZE, cursor)
+    response = json_response([user.to_json(fields=fields)
+                              for user in users])
+    if next_cursor is not None:
+        query = {"limit": limit or MAX_PAGE_SIZE, "cursor": next_cursor}
+        if fields is not None:
+            query["fields"] = ",".join(fields)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = '<{}?{}>; rel="next"'.format(
+            request.base_url, urlencode(query))
+    return _with_validators(response, etag, last_modified)
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -21,8 +171,11 @@ def view_one_user(user_id: str = None) -> str:
     """ GET /api/v1/users/:id
     Path parameter:
       - User ID
+    Query parameter:
+      - fields (optional): comma-separated attributes to return
     Return:
       - User object JSON represented
+      - 304 if If-None-Match/If-Modified-Since match the User
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
@@ -30,7 +183,12 @@ def view_one_user(user_id: str = None) -> str:
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    etag = _etag(user.version())
+    not_modified = _not_modified(etag, user.updated_at)
+    if not_modified is not None:
+        return not_modified
+    response = json_response(user.to_json(fields=_fields()))
+    return _with_validators(response, etag, user.updated_at)
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -59,6 +217,8 @@ def create_user() -> str:
       - password
       - last_name (optional)
       - first_name (optional)
+    Query parameter:
+      - fields (optional): comma-separated attributes to return
     Return:
       - User object JSON represented
       - 400 if can't create the new User
@@ -83,7 +243,7 @@ def create_user() -> str:
             user.first_name = rj.get("first_name")
             user.last_name = rj.get("last_name")
             user.save()
-            return jsonify(user.to_json()), 201
+            return json_response(user.to_json(fields=_fields()), 201)
         except Exception as e:
             error_msg = "Can't create User: {}".format(e)
     return jsonify({'error': error_msg}), 400
@@ -97,6 +257,8 @@ def update_user(user_id: str = None) -> str:
     JSON body:
       - last_name (optional)
       - first_name (optional)
+    Query parameter:
+      - fields (optional): comma-separated attributes to return
     Return:
       - User object JSON represented
       - 404 if the User ID doesn't exist
@@ -119,4 +281,132 @@ def update_user(user_id: str = None) -> str:
     if rj.get('last_name') is not None:
         user.last_name = rj.get('last_name')
     user.save()
-    return jsonify(user.to_json()), 200
+    return json_response(user.to_json(fields=_fields()), 200)
+
+
+def _batch_operations() -> Optional[List]:
+    """ Operations of a batch body, a JSON array or NDJSON lines; None
+    if the body is malformed
+    """
+    if request.mimetype == "application/x-ndjson":
+        try:
+            return [json.loads(line)
+                    for line in request.get_data(as_text=True).splitlines()
+                    if line.strip()]
+        except ValueError:
+            return None
+    try:
+        operations = request.get_json()
+    except Exception:
+        return None
+    return operations if isinstance(operations, list) else None
+
+
+def _check_operation(operation, targeted: Set[str]) -> Tuple[int, str]:
+    """ (status, error) of one batch operation, error being None when
+    it can be applied; ids already targeted in the batch are rejected
+    """
+    if not isinstance(operation, dict):
+        return 400, "Wrong format"
+    kind = operation.get("op")
+    if kind == "create":
+        if operation.get("email", "") == "":
+            return 400, "email missing"
+        password = operation.get("password")
+        if not isinstance(password, str) or password == "":
+            return 400, "password missing"
+        return 201, None
+    if kind in ("update", "delete"):
+        user_id = operation.get("id")
+        if not isinstance(user_id, str) or User.get(user_id) is None:
+            return 404, "Not found"
+        if user_id in targeted:
+            return 400, "id already in batch"
+        targeted.add(user_id)
+        return 200, None
+    return 400, "op must be create, update or delete"
+
+
+def _rejected(checks: List[Tuple[int, str]]) -> Response:
+    """ 400 response of a batch with failed checks: valid operations
+    are reported as 424, since nothing was applied
+    """
+    results = [{"index": i, "status": 424} if error is None
+               else {"index": i, "status": status, "error": error}
+               for i, (status, error) in enumerate(checks)]
+    return json_response({"error": "batch rejected", "results": results},
+                         400)
+
+
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def batch_users() -> str:
+    """ POST /api/v1/users/batch
+    Body: JSON array, or NDJSON (application/x-ndjson), of operations:
+      - {"op": "create", "email", "password", "first_name", "last_name"}
+      - {"op": "update", "id", "first_name", "last_name"}
+      - {"op": "delete", "id"}
+    Query parameter:
+      - fields (optional): comma-separated attributes to return
+    Every operation is checked before any is applied; all are then
+    saved as one store write, new passwords being hashed in parallel.
+    Updates are made on copies, which replace the stored users only
+    once the write succeeds.
+    Return:
+      - {"results": [...]}: per operation, in order, its index, status
+        (201/200) and, for create/update, the User JSON represented
+      - 400 with per-operation results if any operation is invalid;
+        the valid ones have status 424 and nothing is applied; a target
+        removed concurrently is reported as 404 the same way
+      - 413 if there are more than API_MAX_BATCH_SIZE operations
+    """
+    operations = _batch_operations()
+    if operations is None:
+        return jsonify({'error': "Wrong format"}), 400
+    if len(operations) > MAX_BATCH_SIZE:
+        return jsonify({'error': "batch larger than {}"
+                        .format(MAX_BATCH_SIZE)}), 413
+    targeted = set()
+    checks = [_check_operation(op, targeted) for op in operations]
+    if any(error is not None for _, error in checks):
+        return _rejected(checks)
+
+    creates = [op for op in operations if op["op"] == "create"]
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        hashed = iter(pool.map(hashers.make_password,
+                               [op["password"] for op in creates]))
+    saved, removed, results = [], [], []
+    for i, op in enumerate(operations):
+        if op["op"] == "create":
+            user = User(email=op["email"], _password=next(hashed),
+                        first_name=op.get("first_name"),
+                        last_name=op.get("last_name"))
+            saved.append(user)
+        else:
+            user = User.get(op["id"])
+            if user is None:
+                continue
+            if op["op"] == "delete":
+                removed.append(user)
+                results.append({"index": i, "status": 200})
+                continue
+            # A copy, swapped in by save_batch once journaled
+            user = User(**user.to_json(True))
+            if op.get("first_name") is not None:
+                user.first_name = op.get("first_name")
+            if op.get("last_name") is not None:
+                user.last_name = op.get("last_name")
+            saved.append(user)
+        results.append({"index": i, "status": checks[i][0], "user": user})
+    try:
+        User.save_batch(saved, removed, expected=targeted)
+    except MissingObjects as e:
+        # Removed after the checks above
+        gone = set(e.ids)
+        return _rejected([(404, "Not found") if op.get("id") in gone
+                          else check
+                          for op, check in zip(operations, checks)])
+    fields = _fields()
+    for result in results:
+        if "user" in result:
+            result["user"] = result["user"].to_json(fields=fields)
+    return json_response({"results": results}, 200)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+""" Request latency benchmarks for the Basic-auth API
+
+Usage: AUTH_TYPE=basic_auth ./bench_api.py [auth] [requests]
+       ./bench_api.py paths [patterns]
+       AUTH_TYPE=basic_auth ./bench_api.py users [count]
+       ./bench_api.py fields [count]
+       AUTH_TYPE=basic_auth ./bench_api.py conditional [count]
+       AUTH_TYPE=basic_auth ./bench_api.py batch [count]
+       AUTH_TYPE=basic_auth ./bench_api.py metrics [requests]
+       AUTH_TYPE=basic_auth ./bench_api.py startup [runs]
+"""
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """ pct-th percentile of already sorted samples
+    """
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def report(label: str, samples: List[float]) -> None:
+    """ Print p50/p99/mean of latencies given in seconds, as microseconds
+    """
+    samples.sort()
+    print("{:>24} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+        label, percentile(samples, 50) * 1e6, percentile(samples, 99) * 1e6,
+        sum(samples) / len(samples) * 1e6))
+
+
+def timed_get(client, url: str, headers: dict, count: int) -> List[float]:
+    """ Latency of count GET requests
+    """
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return samples
+
+
+def legacy_require_auth(path: str, excluded_paths: List[str]) -> bool:
+    """ The linear scan Auth.require_auth used before PathMatcher
+    """
+    if path in excluded_paths:
+        return False
+    for i in excluded_paths:
+        if i.startswith(path) or path.startswith(i):
+            return False
+        if i[-1] == "*" and path.startswith(i[:-1]):
+            return False
+    return True
+
+
+def paths(patterns: int = 500, lookups: int = 20000) -> None:
+    """ require_auth cost with many excluded patterns
+    """
+    from api.v1.auth.auth import Auth, PathMatcher
+
+    excluded = ["/api/v1/resource{}/".format(i) for i in range(patterns)]
+    excluded[::5] = ["/api/v1/prefix{}*".format(i)
+                     for i in range(len(excluded[::5]))]
+    probes = ["/api/v1/resource{}".format(i) for i in range(1, 50)]
+    probes += ["/api/v1/prefix{}/x".format(i) for i in range(50)]
+    probes += ["/api/v1/users/{}".format(i) for i in range(100)]
+    auth = Auth()
+    matcher = PathMatcher(excluded)
+    cases = (
+        ("linear scan", lambda p: legacy_require_auth(p, excluded)),
+        ("PathMatcher", lambda p: auth.require_auth(p, matcher)),
+    )
+    print("{:>14} {:>10}".format("", "us/call"))
+    for label, fn in cases:
+        start = time.perf_counter()
+        for i in range(lookups):
+            fn(probes[i % len(probes)])
+        elapsed = time.perf_counter() - start
+        print("{:>14} {:>10.2f}".format(label, elapsed / lookups * 1e6))
+
+
+def main(count: int = 2000) -> None:
+    """ Authenticated GET /api/v1/users/<id>, with and without the
+    credential cache
+    """
+    os.chdir(tempfile.mkdtemp())
+    from api.v1.app import app, auth
+    from models.user import User
+
+    user = User(email="bench@example.com")
+    user.password = "bench"
+    user.save()
+    token = base64.b64encode(b"bench@example.com:bench").decode()
+    headers = {"Authorization": "Basic " + token}
+    url = "/api/v1/users/{}".format(user.id)
+    client = app.test_client()
+
+    print("{:>24} {:>10} {:>10} {:>10}".format(
+        "GET /api/v1/users/<id>", "p50 us", "p99 us", "mean us"))
+    report("credential cache", timed_get(client, url, headers, count))
+    auth.credential_cache.maxsize = 0
+    report("no cache", timed_get(client, url, headers, count))
+
+
+def consume(client, url: str, headers: dict) -> int:
+    """ Stream a response body and return its size, without keeping it
+    """
+    response = client.get(url, headers=headers, buffered=False)
+    assert response.status_code == 200, response.status_code
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return size
+
+
+def peak_mib(fn: Callable) -> float:
+    """ Peak traced allocation of fn(), in MiB
+    """
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def users(count: int = 1000000, pages: int = 500) -> None:
+    """ GET /api/v1/users: full list vs pages vs streamed export
+    """
+    os.chdir(tempfile.mkdtemp())
+    from api.v1.app import app
+    from models.user import User
+
+    user = User(email="bench@example.com")
+    user.password = "bench"
+    user.save()
+    for i in range(count - 1):
+        User._store(User(email="user{}@example.com".format(i)))
+    token = base64.b64encode(b"bench@example.com:bench").decode()
+    headers = {"Authorization": "Basic " + token}
+    client = app.test_client()
+    url = "/api/v1/users"
+    User.page(1)
+
+    def paged():
+        cursors = [None] + [o.id for o in User.all()[::count // pages]]
+        samples = []
+        for cursor in cursors[:pages]:
+            query = "?limit=100" + ("&cursor=" + cursor if cursor else "")
+            start = time.perf_counter()
+            consume(client, url + query, headers)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    cases = (
+        ("full list", lambda: consume(client, url, headers), 3),
+        ("stream=json", lambda: consume(client, url + "?stream=json",
+                                        headers), 3),
+        ("stream=ndjson", lambda: consume(client, url + "?stream=ndjson",
+                                          headers), 3),
+    )
+    print("{:>14} {:>12} {:>12} {:>12}".format(
+        "{} users".format(count), "p50 ms", "p99 ms", "peak MiB"))
+    for label, fn, reps in cases:
+        samples = []
+        for _ in range(reps):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        print("{:>14} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+            label, percentile(samples, 50) * 1e3,
+            percentile(samples, 99) * 1e3, peak_mib(fn)))
+    samples = sorted(paged())
+    print("{:>14} {:>12.2f} {:>12.2f} {:>12.1f}".format(
+        "limit=100", percentile(samples, 50) * 1e3,
+        percentile(samples, 99) * 1e3,
+        peak_mib(lambda: consume(client, url + "?limit=100", headers))))
+
+
+def fields(count: int = 100000) -> None:
+    """ to_json + encode cost per user: all attributes vs id,email, for
+    each installed JSON backend
+    """
+    from api.v1.json_response import _load_backend
+    from models.user import User
+
+    objs = [User(email="user{}@example.com".format(i), first_name="F",
+                 last_name="L") for i in range(count)]
+    print("{:>8} {:>12} {:>12}".format(
+        "backend", "all us/user", "id,email"))
+    for name in ("json", "orjson", "ujson"):
+        backend, dumps = _load_backend(name)
+        if backend != name:
+            continue
+        row = []
+        for projection in (None, ("id", "email")):
+            start = time.perf_counter()
+            dumps([obj.to_json(fields=projection) for obj in objs])
+            row.append((time.perf_counter() - start) / count * 1e6)
+        print("{:>8} {:>12.2f} {:>12.2f}".format(name, *row))
+
+
+def conditional(count: int = 10000, polls: int = 50) -> None:
+    """ Polling cost of unchanged resources: plain GET vs If-None-Match
+    """
+    os.chdir(tempfile.mkdtemp())
+    from api.v1.app import app
+    from models.user import User
+
+    user = User(email="bench@example.com")
+    user.password = "bench"
+    user.save()
+    for i in range(count - 1):
+        User._store(User(email="user{}@example.com".format(i)))
+    token = base64.b64encode(b"bench@example.com:bench").decode()
+    headers = {"Authorization": "Basic " + token}
+    client = app.test_client()
+
+    print("{:>26} {:>10} {:>10} {:>10}".format(
+        "", "p50 us", "p99 us", "bytes"))
+    for label, url in (("GET /users/<id>", "/api/v1/users/" + user.id),
+                       ("GET /users ({})".format(count), "/api/v1/users")):
+        first = client.get(url, headers=headers)
+        revalidate = dict(headers, **{"If-None-Match": first.headers["ETag"]})
+        for suffix, sent in (("", headers), (" 304", revalidate)):
+            samples = []
+            for _ in range(polls):
+                start = time.perf_counter()
+                response = client.get(url, headers=sent)
+                samples.append(time.perf_counter() - start)
+            samples.sort()
+            print("{:>26} {:>10.1f} {:>10.1f} {:>10}".format(
+                label + suffix, percentile(samples, 50) * 1e6,
+                percentile(samples, 99) * 1e6, len(response.data)))
+
+
+def batch(count: int = 2000) -> None:
+    """ Import count users: one POST /users each vs one POST /users/batch
+    """
+    os.chdir(tempfile.mkdtemp())
+    from api.v1.app import app
+    from models import hashers
+    from models.user import User
+
+    user = User(email="bench@example.com")
+    user.password = "bench"
+    user.save()
+    token = base64.b64encode(b"bench@example.com:bench").decode()
+    headers = {"Authorization": "Basic " + token}
+    client = app.test_client()
+
+    def payload(prefix):
+        return [{"op": "create", "email": "{}{}@example.com".format(prefix, i),
+                 "password": "pwd{}".format(i)} for i in range(count)]
+
+    def one_by_one():
+        for op in payload("single"):
+            response = client.post("/api/v1/users", headers=headers, json=op)
+            assert response.status_code == 201, response.status_code
+
+    def batched():
+        response = client.post("/api/v1/users/batch?fields=id",
+                               headers=headers, json=payload("batch"))
+        assert response.status_code == 200, response.status_code
+
+    print("{} users, {} hasher".format(count, hashers.DEFAULT_HASHER))
+    print("{:>18} {:>10} {:>12}".format("", "seconds", "users/s"))
+    for label, fn in (("POST /users", one_by_one),
+                      ("POST /users/batch", batched)):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print("{:>18} {:>10.2f} {:>12.0f}".format(
+            label, elapsed, count / elapsed))
+
+
+def metrics_overhead(count: int = 5000) -> None:
+    """ Cost of the instrumentation: hooks alone, and end to end with
+    API_METRICS on vs off
+    """
+    os.chdir(tempfile.mkdtemp())
+    from api.v1 import metrics
+    from api.v1.app import app
+    from models.user import User
+
+    class FakeRule:
+        rule = "/api/v1/users/<user_id>"
+
+    class FakeRequest:
+        method = "GET"
+        url_rule = FakeRule()
+
+    class FakeResponse:
+        status_code = 200
+
+    def hooks():
+        request, response = FakeRequest(), FakeResponse()
+        metrics.start_request(request)
+        for name in ("require_auth", "decode", "search", "verify",
+                     "serialize"):
+            metrics.stage(name, metrics.clock())
+        metrics.view_started(request)
+        metrics.finish_request(request, response)
+
+    start = time.perf_counter()
+    for _ in range(count * 10):
+        hooks()
+    hook_us = (time.perf_counter() - start) / (count * 10) * 1e6
+    print("hooks per request (7 histograms): {:.2f} us".format(hook_us))
+
+    user = User(email="bench@example.com")
+    user.password = "bench"
+    user.save()
+    token = base64.b64encode(b"bench@example.com:bench").decode()
+    headers = {"Authorization": "Basic " + token}
+    url = "/api/v1/users/{}".format(user.id)
+    client = app.test_client()
+    print("{:>24} {:>10} {:>10} {:>10}".format(
+        "GET /api/v1/users/<id>", "p50 us", "p99 us", "mean us"))
+    for enabled in (False, True, False, True):
+        metrics.ENABLED = enabled
+        report("API_METRICS=" + ("on" if enabled else "off"),
+               timed_get(client, url, headers, count))
+
+
+STARTUP_PROBES = (
+    ("import api.v1.app", "import api.v1.app"),
+    ("from api.v1.app import app", "from api.v1.app import app"),
+)
+
+
+def startup(runs: int = 10) -> None:
+    """ Cold start of a fresh interpreter, and create_app phases
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(tempfile.mkdtemp())
+    env = dict(os.environ, PYTHONPATH=here)
+    print("{:>28} {:>10} {:>10}".format("", "p50 ms", "max ms"))
+    for label, code in STARTUP_PROBES:
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], env=env, check=True)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        print("{:>28} {:>10.1f} {:>10.1f}".format(
+            label, percentile(samples, 50) * 1e3, samples[-1] * 1e3))
+    env["API_STARTUP_REPORT"] = "1"
+    subprocess.run([sys.executable, "-c", "from api.v1.app import app"],
+                   env=env, check=True)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    command = args.pop(0) if args and not args[0].isdigit() else "auth"
+    if command == "paths":
+        paths(*(int(arg) for arg in args[:1]))
+    elif command == "fields":
+        fields(*(int(arg) for arg in args[:1]))
+    elif command == "conditional":
+        conditional(*(int(arg) for arg in args[:1]))
+    elif command == "startup":
+        startup(*(int(arg) for arg in args[:1]))
+    elif command == "metrics":
+        metrics_overhead(*(int(arg) for arg in args[:1]))
+    elif command == "batch":
+        batch(*(int(arg) for arg in args[:1]))
+    elif command == "users":
+        users(*(int(arg) for arg in args[:1]))
+    else:
+        main(*(int(arg) for arg in args[:1]))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" Benchmarks for the models store
+
+Usage: ./bench_models.py search [count,count,...]
+       ./bench_models.py load [count]
+       ./bench_models.py memory [count]
+       ./bench_models.py hashers [count]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from models import hashers
+from models.user import User
+
+DEFAULT_COUNTS = (10000, 100000, 1000000)
+LOOKUPS = 1000
+
+
+def populate(count: int) -> None:
+    """ Fill the in-memory store with count users, without touching disk
+    """
+    for i in range(len(User._objects()), count):
+        User._store(User(email="user{}@example.com".format(i)))
+
+
+def per_call(fn: Callable, count: int) -> float:
+    """ Mean microseconds per call of fn(i) over count calls
+    """
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - start) * 1e6 / count
+
+
+def search(counts=DEFAULT_COUNTS) -> None:
+    """ Print search latency for indexed and full-scan lookups
+    """
+    print("{:>9} {:>14} {:>14}".format("users", "index us/op", "scan us/op"))
+    for count in counts:
+        populate(count)
+
+        def indexed(i):
+            User.search({"email": "user{}@example.com".format(i * 7)})
+
+        def scan(i):
+            email = "user{}@example.com".format(i * 7)
+            [u for u in User._objects().values() if u.email == email]
+
+        print("{:>9} {:>14.2f} {:>14.2f}".format(
+            count, per_call(indexed, LOOKUPS),
+            per_call(scan, max(1, LOOKUPS * 1000 // count))))
+
+
+# Peak RSS comes from VmHWM: ru_maxrss survives exec, so a child
+# started by a large parent would report the parent's peak.
+LOAD_PROBE = """
+import time
+from models import hashers
+from models.user import User
+start = time.perf_counter()
+User.load_from_file()
+ready = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = [l.split()[1] for l in f if l.startswith("VmHWM")][0]
+found = time.perf_counter()
+User.search({"email": "user7@example.com"})
+search = time.perf_counter() - found
+User.ensure_warm()
+warm = time.perf_counter() - start
+print(ready, rss, search, warm)
+"""
+
+
+def load(count: int = 1000000) -> None:
+    """ Print cold-start time and RSS of load_from_file per load mode
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        populate(count)
+        User.save_to_file()
+        print("{:>6} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+            "mode", "warm-up", "ready s", "RSS MiB", "search s", "warm s"))
+        modes = (("eager", "off"), ("lazy", "background"), ("lazy", "off"))
+        for mode, warm_mode in modes:
+            env = dict(os.environ, MODELS_LOAD_MODE=mode,
+                       MODELS_WARM=warm_mode, PYTHONPATH=here)
+            out = subprocess.run([sys.executable, "-c", LOAD_PROBE],
+                                 env=env, check=True, capture_output=True)
+            ready, rss, search, warm = out.stdout.split()
+            print("{:>6} {:>10} {:>10.2f} {:>10.1f} {:>10.3f} {:>10.2f}"
+                  .format(mode, warm_mode, float(ready), int(rss) / 1024,
+                          float(search), float(warm)))
+
+
+class DictUser:
+    """ The pre-__slots__ layout: same attributes in a per-instance dict
+    """
+
+    def __init__(self, user: User):
+        """ Copy the attributes of a User
+        """
+        for name in User.attribute_names():
+            setattr(self, name, getattr(user, name))
+
+
+def bytes_per_object(factory: Callable, count: int) -> float:
+    """ Mean traced allocation per object built by factory(i)
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [factory(i) for i in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objs
+    return used / count
+
+
+def memory(count: int = 1000000) -> None:
+    """ Print bytes per user for the slots and dict layouts
+    """
+    def slotted(i):
+        return User(email="user{}@example.com".format(i))
+
+    def dicted(i):
+        return DictUser(slotted(i))
+
+    print("{:>9} {:>12} {:>12}".format("users", "layout", "bytes/user"))
+    for label, factory in (("__slots__", slotted), ("__dict__", dicted)):
+        print("{:>9} {:>12} {:>12.1f}".format(
+            count, label, bytes_per_object(factory, count)))
+
+
+def verify_rate(pwd: str, encoded: str, count: int) -> float:
+    """ check_password calls per second against one stored hash
+    """
+    start = time.perf_counter()
+    for _ in range(count):
+        hashers.check_password(pwd, encoded)
+    return count / (time.perf_counter() - start)
+
+
+def hashers_bench(count: int = 20) -> None:
+    """ Print verification throughput per scheme, cold and cached
+    """
+    print("{:>14} {:>12} {:>14}".format(
+        "scheme", "cold ops/s", "cached ops/s"))
+    for algorithm in hashers.HASHERS:
+        encoded = hashers.make_password("bench", algorithm)
+        size = hashers.verification_cache.maxsize
+        hashers.verification_cache.maxsize = 0
+        cold = verify_rate("bench", encoded, count)
+        hashers.verification_cache.maxsize = size
+        hashers.verification_cache.add("bench", encoded)
+        cached = verify_rate("bench", encoded, count * 1000)
+        print("{:>14} {:>12.1f} {:>14.0f}".format(algorithm, cold, cached))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "search"
+    args = sys.argv[2:]
+    if command == "load":
+        load(*(int(n) for n in args[:1]))
+    elif command == "memory":
+        memory(*(int(n) for n in args[:1]))
+    elif command == "hashers":
+        hashers_bench(*(int(n) for n in args[:1]))
+    else:
+        search(*(tuple(int(n) for n in a.split(",")) for a in args[:1]))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+""" Load test: requests/second of the dev server vs gunicorn
+
+Usage: ./bench_wsgi.py [clients] [seconds]
+
+Each server is started in a temporary directory holding one user, then
+`clients` processes send authenticated GET /api/v1/users/<id> requests
+for `seconds`.  gunicorn runs 1 worker, then API_WORKERS workers (one
+per CPU by default, as in gunicorn.conf.py), each with API_THREADS
+threads (1 by default).
+"""
+import base64
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PORT = 5099
+
+
+def prepare(workdir: str) -> str:
+    """ Save one user in workdir and return its id
+    """
+    os.chdir(workdir)
+    from models.user import User
+
+    user = User(email="bench@example.com")
+    user.password = "bench"
+    user.save()
+    User.save_to_file()
+    return user.id
+
+
+def wait_ready(timeout: float = 30) -> None:
+    """ Block until the server answers GET /api/v1/status
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            conn.request("GET", "/api/v1/status")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def client(args: tuple) -> int:
+    """ Requests completed by one client before its deadline
+    """
+    url, headers, deadline = args
+    done = 0
+    while time.time() < deadline:
+        conn = http.client.HTTPConnection("127.0.0.1", PORT)
+        conn.request("GET", url, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        if response.status == 200:
+            done += 1
+    return done
+
+
+def run(label: str, command: list, env: dict, user_id: str,
+        clients: int, seconds: float) -> None:
+    """ Start a server, load it, print requests/second and stop it
+    """
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        wait_ready()
+        token = base64.b64encode(b"bench@example.com:bench").decode()
+        headers = {"Authorization": "Basic " + token}
+        url = "/api/v1/users/{}".format(user_id)
+        client((url, headers, time.time() + 1))
+        deadline = time.time() + seconds
+        with multiprocessing.Pool(clients) as pool:
+            done = sum(pool.map(client, [(url, headers, deadline)] * clients))
+        print("{:>28} {:>10.0f}".format(label, done / seconds))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(clients: int = 8, seconds: float = 10) -> None:
+    """ Compare the dev server with gunicorn
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp()
+    user_id = prepare(workdir)
+    env = dict(os.environ, PYTHONPATH=here, API_HOST="127.0.0.1",
+               API_PORT=str(PORT), AUTH_TYPE="basic_auth")
+    workers = env.get("API_WORKERS", str(os.cpu_count() or 1))
+    threads = env.get("API_THREADS", "1")
+    print("{} clients, {} s, {} CPU".format(clients, seconds,
+                                            os.cpu_count()))
+    print("{:>28} {:>10}".format("server", "req/s"))
+    run("app.run (dev server)", [sys.executable, "-m", "api.v1.app"],
+        env, user_id, clients, seconds)
+    for count in sorted({"1", workers}, key=int):
+        run("gunicorn {}w x {}t".format(count, threads),
+            [sys.executable, "-m", "gunicorn", "-c",
+             os.path.join(here, "gunicorn.conf.py"), "wsgi:app"],
+            dict(env, API_WORKERS=count), user_id, clients, seconds)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+""" gunicorn settings for serving the Basic-auth API
+
+Usage: AUTH_TYPE=basic_auth gunicorn -c gunicorn.conf.py wsgi:app
+
+The app and the user store are loaded once in the master, then workers
+are forked and share those objects copy-on-write.  Each worker keeps
+its own copy of the store and they stay in step through its journal:
+writes append to it under a lock file after applying what the other
+workers appended, and every request first applies the entries written
+since (see Base.refresh).  A compaction starts a new journal rather
+than truncating the old one, so a worker restarted by gunicorn, forked
+from the store as the master loaded it, reads on into the current
+journal, or reloads from disk if more than one compaction happened.
+"""
+import gc
+import os
+
+bind = "{}:{}".format(os.getenv("API_HOST", "0.0.0.0"),
+                      int(os.getenv("API_PORT", "5000")))
+workers = int(os.getenv("API_WORKERS", str(os.cpu_count() or 1)))
+threads = int(os.getenv("API_THREADS", "1"))
+preload_app = True
+
+# Threads do not survive fork: wsgi.py builds every object in the
+# master rather than in a background warm-up thread
+os.environ.setdefault("MODELS_WARM", "off")
+
+
+def when_ready(server) -> None:
+    """ Move the preloaded objects out of the collector's reach, so
+    collections in the workers do not dirty the shared pages
+    """
+    gc.freeze()
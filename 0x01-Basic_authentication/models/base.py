@@ -1,13 +1,1128 @@
-root@f4e163368c85:/alx-backend-user-data/0x01-Basic_authentication# API_HOST=0.0.0.0 API_PORT=5000 python3 -m api.v1.app
-Traceback (most recent call last):
-  File "/usr/local/lib/python3.7/runpy.py", line 193, in _run_module_as_main
-    "__main__", mod_spec)
-  File "/usr/local/lib/python3.7/runpy.py", line 85, in _run_code
-    exec(code, run_globals)
-  File "/alx-backend-user-data/0x01-Basic_authentication/api/v1/app.py", line 8, in <module>
-    from api.v1.views import app_views
-  File "/alx-backend-user-data/0x01-Basic_authentication/api/v1/views/__init__.py", line 9, in <module>
-    from api.v1.views.users import *
-  File "/alx-backend-user-data/0x01-Basic_authentication/api/v1/views/users.py", line 6, in <module>
-    from models.user import User
-ModuleNotFoundError: No module named 'models'
+#!/usr/bin/env python3
+""" Base module
+"""
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import (
+    Callable, TypeVar, List, Iterable, Iterator, Optional, Tuple
+)
+from os import getenv, path
+import bisect
+import fcntl
+import itertools
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DATA = {}
+INDEXES = {}
+ATTRIBUTES = {}
+LISTENERS = {}
+# Sorted ids per class, built on the first ordered read (page and
+# iter_ordered) and kept in step by _store/_unstore afterwards.
+ORDERS = {}
+# (change counter, last change time) per class, bumped by every store
+# write; versions embed a per-process nonce since counters restart.
+VERSIONS = {}
+PROCESS_NONCE = uuid.uuid4().hex[:12]
+# saves/removes/loads and last save or remove time per class, for stats()
+COUNTERS = {}
+
+# Write-ahead journal: every save/remove appends one JSON line to
+# .db_<Class>.journal; the snapshot is rewritten only on compaction.
+# The journal is also how processes sharing the files (gunicorn
+# workers) see each other's writes: each one tails it under a lock on
+# .db_<Class>.lock, and compaction starts a new journal whose first
+# line is {"op": "generation", "n": <previous n + 1>}.
+FSYNC_POLICY = getenv("MODELS_FSYNC", "never")  # always | interval | never
+FSYNC_INTERVAL = float(getenv("MODELS_FSYNC_INTERVAL", "1.0"))
+COMPACT_EVERY = int(getenv("MODELS_COMPACT_EVERY", "1000"))
+JOURNALS = {}
+_store_lock = threading.RLock()
+# [lock file descriptor, depth] per class, for this process only
+LOCK_FILES = {}
+
+# eager: build every object at load time.  lazy: mmap the snapshot,
+# build objects on first access and warm the rest in the background.
+LOAD_MODE = getenv("MODELS_LOAD_MODE", "eager")
+WARM_MODE = getenv("MODELS_WARM", "background")  # background | off
+WARM_CHUNK = 1000
+
+
+class MissingObjects(LookupError):
+    """ Objects a batch expected to find were removed meanwhile
+    """
+
+    def __init__(self, ids: List[str]):
+        """ Record the ids that were not found
+        """
+        super().__init__("objects not found: {}".format(", ".join(ids)))
+        self.ids = ids
+
+
+def _new_process_nonce() -> None:
+    """ Give a forked child its own nonce: its counters diverge
+    """
+    global PROCESS_NONCE
+    PROCESS_NONCE = uuid.uuid4().hex[:12]
+
+
+def _forget_lock_files() -> None:
+    """ Drop the lock files inherited from the parent: a flock belongs
+    to the open file, which the parent still uses
+    """
+    for fd, depth in LOCK_FILES.values():
+        os.close(fd)
+    LOCK_FILES.clear()
+
+
+os.register_at_fork(after_in_child=_new_process_nonce)
+os.register_at_fork(after_in_child=_forget_lock_files)
+
+# Background thread bounding the un-fsynced window of interval policy
+_fsync_thread = None
+
+
+def _fsync_loop() -> None:
+    """ Every FSYNC_INTERVAL, fsync the journals written since their
+    last fsync, so the last writes of a burst are not left unsynced
+    """
+    while True:
+        time.sleep(FSYNC_INTERVAL)
+        with _store_lock:
+            for journal in list(JOURNALS.values()):
+                if journal is not None and journal["dirty"]:
+                    os.fsync(journal["fd"])
+                    journal["dirty"] = False
+                    journal["synced"] = time.monotonic()
+
+
+def _start_fsync_thread() -> None:
+    """ Start the interval fsync thread once per process
+    """
+    global _fsync_thread
+    if _fsync_thread is None or not _fsync_thread.is_alive():
+        _fsync_thread = threading.Thread(target=_fsync_loop, daemon=True,
+                                         name="journal-fsync")
+        _fsync_thread.start()
+
+
+@lru_cache(maxsize=256)
+def _projection(cls: type, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+    """ Cached body of Base.projection, bounded since fields come from
+    clients
+    """
+    wanted = set(fields)
+    return tuple(name for name in cls.attribute_names()
+                 if name in wanted and name[0] != '_')
+
+
+class LazyObjects(MutableMapping):
+    """ Objects keyed by id, backed by a memory-mapped snapshot
+
+    Ids not yet touched map to the (offset, length) of their JSON in
+    the snapshot; they are turned into objects, and indexed, on access.
+    """
+
+    def __init__(self, cls: type, snapshot: mmap.mmap, offsets: dict,
+                 values: dict = None):
+        """ Wrap a mapped snapshot and its offset index; values maps
+        each id to the JSON list of its snapshot values of
+        cls.indexed_attributes, when the index recorded them
+        """
+        self.cls = cls
+        self.loaded = {}
+        self._snapshot = snapshot
+        self._offsets = offsets
+        self._values = values
+        self._pending_index = None
+
+    def __getitem__(self, key: str):
+        """ Object of an id, built from the snapshot on first access
+        """
+        obj = self.loaded.get(key)
+        if obj is None:
+            obj = self._materialise(key)
+        return obj
+
+    def __setitem__(self, key: str, obj) -> None:
+        """ Store a built object; its snapshot copy is no longer used
+        """
+        self._offsets.pop(key, None)
+        self.loaded[key] = obj
+
+    def __delitem__(self, key: str) -> None:
+        """ Forget an id, built or still pending
+        """
+        if key in self.loaded:
+            del self.loaded[key]
+        else:
+            del self._offsets[key]
+
+    def __contains__(self, key) -> bool:
+        """ True if the id is stored, without building its object
+        """
+        return key in self.loaded or key in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        """ Ids of built objects, then of pending ones
+        """
+        yield from list(self.loaded)
+        yield from list(self._offsets)
+
+    def __len__(self) -> int:
+        """ Number of stored ids, built or pending
+        """
+        return len(self.loaded) + len(self._offsets)
+
+    def raw(self, key: str) -> Optional[bytes]:
+        """ Snapshot JSON of an object not yet materialised
+        """
+        span = self._offsets.get(key)
+        if span is None:
+            return None
+        return self._snapshot[span[0]:span[0] + span[1]]
+
+    def values_of(self, key: str) -> Tuple:
+        """ Snapshot values of the indexed attributes of a pending object
+        """
+        if self._values is not None and key in self._values:
+            return tuple(json.loads(self._values[key]))
+        data = json.loads(self.raw(key))
+        return tuple(data.get(k) for k in self.cls.indexed_attributes)
+
+    def lookup(self, attributes: dict) -> Optional[List]:
+        """ Stored objects with the value of one indexed attribute among
+        attributes, materialising only the pending objects that have it
+
+        Return None when no indexed attribute can be used (the index
+        did not record values), so the caller must scan everything
+        """
+        with _store_lock:
+            by_value = self._by_value()
+            if by_value is None:
+                return None
+            for k, v in attributes.items():
+                if k not in by_value:
+                    continue
+                try:
+                    pending = by_value[k].get(v, ())
+                except TypeError:
+                    continue
+                for key in pending:
+                    if key in self._offsets:
+                        self._materialise(key)
+                bucket = INDEXES[self.cls.__name__][k].get(v, {})
+                return list(bucket.values())
+            return None
+
+    def _by_value(self) -> Optional[dict]:
+        """ Pending ids per indexed attribute and snapshot value, built
+        on first use from the recorded values
+        """
+        if self._pending_index is None and self._values is not None:
+            index = {k: {} for k in self.cls.indexed_attributes}
+            for key, values in self._values.items():
+                for k, v in zip(self.cls.indexed_attributes,
+                                json.loads(values)):
+                    try:
+                        index[k].setdefault(v, []).append(key)
+                    except TypeError:
+                        pass
+            self._pending_index = index
+        return self._pending_index
+
+    def pending(self) -> int:
+        """ Number of objects still on disk only
+        """
+        return len(self._offsets)
+
+    def warm(self, limit: int = None, keys: Iterator[str] = None) -> int:
+        """ Materialise up to limit (default: all) pending objects
+
+        keys is an iterator over a snapshot of the pending ids; sharing
+        it across calls makes each chunk resume where the last one
+        stopped instead of copying every pending id again.
+
+        Return:
+          - the number of ids taken from keys (0 once it is exhausted)
+        """
+        with _store_lock:
+            if keys is None:
+                keys = iter(list(self._offsets))
+            taken = 0
+            for key in itertools.islice(keys, limit):
+                taken += 1
+                if key in self._offsets:
+                    self._materialise(key)
+            return taken
+
+    def _materialise(self, key: str):
+        """ Build a pending object from its snapshot JSON, move it to
+        loaded and add it to the secondary indexes
+        """
+        with _store_lock:
+            obj = self.loaded.get(key)
+            if obj is not None:
+                return obj
+            offset, length = self._offsets[key]
+            data = self._snapshot[offset:offset + length]
+            obj = self.cls(**json.loads(data))
+            del self._offsets[key]
+            self.loaded[key] = obj
+            self.cls._index_add(obj, self.cls.indexed_attributes)
+            return obj
+
+
+class Base():
+    """ Base class
+
+    Attributes live in __slots__ rather than a per-instance __dict__;
+    subclasses declare their own __slots__ to stay dict-free.
+    """
+
+    __slots__ = ("id", "created_at", "updated_at")
+
+    # Attributes with a hash index, so search() on them is O(1)
+    indexed_attributes: Tuple[str, ...] = ()
+
+    def __init__(self, *args: list, **kwargs: dict):
+        """ Initialize a Base instance
+        """
+        self.__class__._objects()
+
+        self.id = kwargs.get('id', str(uuid.uuid4()))
+        if kwargs.get('created_at') is not None:
+            self.created_at = datetime.strptime(kwargs.get('created_at'),
+                                                TIMESTAMP_FORMAT)
+        else:
+            self.created_at = datetime.utcnow()
+        if kwargs.get('updated_at') is not None:
+            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
+                                                TIMESTAMP_FORMAT)
+        else:
+            self.updated_at = datetime.utcnow()
+
+    def __setattr__(self, name: str, value) -> None:
+        """ Keep secondary indexes in step with stored objects
+        """
+        if name in self.indexed_attributes and self._is_stored():
+            self.__class__._index_remove(self, (name,))
+            super().__setattr__(name, value)
+            self.__class__._index_add(self, (name,))
+        else:
+            super().__setattr__(name, value)
+
+    def __eq__(self, other: TypeVar('Base')) -> bool:
+        """ Equality
+        """
+        if type(self) != type(other):
+            return False
+        if not isinstance(self, Base):
+            return False
+        return (self.id == other.id)
+
+    def to_json(self, for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
+        """ Convert the object a JSON dictionary
+
+        With fields, only those public attributes are read and returned
+        """
+        names = None if fields is None else self.projection(fields)
+        result = {}
+        for key, value in self._attribute_items(names):
+            if not for_serialization and key[0] == '_':
+                continue
+            if type(value) is datetime:
+                result[key] = value.strftime(TIMESTAMP_FORMAT)
+            else:
+                result[key] = value
+        return result
+
+    @classmethod
+    def attribute_names(cls) -> Tuple[str, ...]:
+        """ Slot attributes from Base down to cls, in declaration order
+        """
+        names = ATTRIBUTES.get(cls)
+        if names is None:
+            names = tuple(
+                name for klass in reversed(cls.__mro__)
+                for name in klass.__dict__.get("__slots__", ())
+                if name not in ("__dict__", "__weakref__")
+            )
+            ATTRIBUTES[cls] = names
+        return names
+
+    @classmethod
+    def projection(cls, fields: Iterable[str]) -> Tuple[str, ...]:
+        """ Public attributes of cls among fields, in declaration order;
+        unknown names are ignored
+        """
+        return _projection(cls, tuple(fields))
+
+    def _attribute_items(self, names: Iterable[str] = None
+                         ) -> Iterator[Tuple[str, object]]:
+        """ (name, value) of every attribute set on the instance, or of
+        the given slot attributes only
+        """
+        missing = object()
+        for name in self.attribute_names() if names is None else names:
+            value = getattr(self, name, missing)
+            if value is not missing:
+                yield name, value
+        if names is None:
+            yield from getattr(self, "__dict__", {}).items()
+
+    @classmethod
+    def load_from_file(cls):
+        """ Load all objects from the snapshot, then replay the journal
+
+        In lazy mode (MODELS_LOAD_MODE=lazy) the snapshot is mapped and
+        objects are built on first access; unless MODELS_WARM=off, a
+        background thread warms the rest.
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        with _store_lock, cls._locked():
+            DATA[s_class] = {}
+            INDEXES[s_class] = {k: {} for k in cls.indexed_attributes}
+            ORDERS.pop(s_class, None)
+            cls._touch()
+            cls._close_journal()
+            lazy = None
+            if LOAD_MODE == "lazy" and path.exists(file_path):
+                lazy = cls._map_snapshot(file_path)
+            if lazy is not None:
+                DATA[s_class] = lazy
+            elif path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        cls._store(cls(**obj_json))
+            cls._open_journal(replay=True)
+            cls._count("loads")
+        if lazy is not None and WARM_MODE == "background":
+            threading.Thread(target=cls._warm_up, daemon=True,
+                             name="warm-{}".format(s_class)).start()
+
+    @classmethod
+    def save_to_file(cls):
+        """ Save all objects to file and start a new journal (compaction)
+
+        The snapshot keeps one object per line so that an offset index
+        (.db_<Class>.idx) can point into it for lazy loading; the index
+        also records the indexed attribute values of each object, so a
+        lazy search on them does not warm the store.
+
+        The journal is replaced, never truncated in place, so processes
+        still reading the old one finish it before moving on.
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        with cls._writing():
+            objs = cls._objects()
+            raw = getattr(objs, "raw", lambda obj_id: None)
+            indexed = cls.indexed_attributes
+            last = len(objs) - 1
+            offsets = []
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(b"{\n")
+                offset = 2
+                for n, obj_id in enumerate(objs):
+                    key = json.dumps(obj_id).encode() + b": "
+                    body = raw(obj_id)
+                    if body is None:
+                        obj = objs[obj_id]
+                        body = json.dumps(obj.to_json(True)).encode()
+                        values = [getattr(obj, k, None) for k in indexed]
+                    else:
+                        values = list(objs.values_of(obj_id))
+                    line = key + body + (b",\n" if n < last else b"\n")
+                    f.write(line)
+                    offsets.append("{}\t{}\t{}\t{}\n".format(
+                        obj_id, offset + len(key), len(body),
+                        json.dumps(values)))
+                    offset += len(line)
+                f.write(b"}\n")
+                cls._sync(f)
+            idx_tmp = cls._index_path() + ".tmp"
+            with open(idx_tmp, 'w') as f:
+                f.write("{}\t{}\n".format(offset + 2,
+                                          json.dumps(list(indexed))))
+                f.writelines(offsets)
+                cls._sync(f)
+            journal_tmp = cls._journal_path() + ".tmp"
+            with open(journal_tmp, 'wb') as f:
+                f.write(cls._generation_line(JOURNALS[s_class]["gen"] + 1))
+                cls._sync(f)
+            os.replace(tmp_path, file_path)
+            os.replace(idx_tmp, cls._index_path())
+            cls._close_journal()
+            os.replace(journal_tmp, cls._journal_path())
+            cls._open_journal(replay=False)
+            # The on-disk size reported by stats() changed
+            cls._touch()
+
+    def save(self):
+        """ Save current object
+
+        The journal entry is written first: if that fails the store is
+        left unchanged
+        """
+        self.updated_at = datetime.utcnow()
+        with self.__class__._writing() as events:
+            self.__class__._journal_append(
+                {"op": "upsert", "obj": self.to_json(True)}, compact=False
+            )
+            self.__class__._store(self)
+            self.__class__._count("saves")
+            events.append(("save", self))
+            self.__class__._compact_if_due()
+
+    def remove(self):
+        """ Remove object
+
+        The journal entry is written first: if that fails the object
+        stays stored
+        """
+        with self.__class__._writing() as events:
+            if self.__class__._objects().get(self.id) is None:
+                return
+            self.__class__._journal_append(
+                {"op": "delete", "id": self.id}, compact=False
+            )
+            self.__class__._unstore(self.id)
+            self.__class__._count("removes")
+            events.append(("remove", self))
+            self.__class__._compact_if_due()
+
+    @classmethod
+    def save_batch(cls, saved: Iterable['Base'] = (),
+                   removed: Iterable['Base'] = (),
+                   expected: Iterable[str] = ()) -> None:
+        """ Save and remove many objects as one journal entry
+
+        The ids in expected must all still be stored; otherwise nothing
+        is applied and MissingObjects is raised. The entry is written
+        and flushed before the store changes, so a failed write leaves
+        the store untouched, and it is replayed whole or not at all
+        after a crash; listeners run after the store lock is released.
+        """
+        saved = list(saved)
+        now = datetime.utcnow()
+        with cls._writing() as events:
+            objs = cls._objects()
+            missing = [obj_id for obj_id in expected if obj_id not in objs]
+            if missing:
+                raise MissingObjects(missing)
+            removed = [obj for obj in removed if obj.id in objs]
+            if not saved and not removed:
+                return
+            ops = []
+            for obj in saved:
+                obj.updated_at = now
+                ops.append({"op": "upsert", "obj": obj.to_json(True)})
+            ops.extend({"op": "delete", "id": obj.id} for obj in removed)
+            cls._journal_append({"op": "batch", "ops": ops}, compact=False)
+            for obj in saved:
+                cls._store(obj)
+            for obj in removed:
+                cls._unstore(obj.id)
+            if saved:
+                cls._count("saves", len(saved))
+            if removed:
+                cls._count("removes", len(removed))
+            events.extend(("save", obj) for obj in saved)
+            events.extend(("remove", obj) for obj in removed)
+            cls._compact_if_due()
+
+    @classmethod
+    def refresh(cls) -> None:
+        """ Apply the writes other processes journaled since this one
+        last read the journal; cheap when there are none
+        """
+        with _store_lock:
+            if cls._journal_current():
+                return
+        with cls._writing():
+            pass
+
+    @classmethod
+    def add_listener(cls, listener: Callable[[str, 'Base'], None]) -> None:
+        """ Call listener(event, obj) after each save/remove of cls
+        objects, including those read from other processes' writes;
+        event is "save" or "remove", or "reload" (obj None) when the
+        whole store was reloaded
+        """
+        LISTENERS.setdefault(cls.__name__, []).append(listener)
+
+    @classmethod
+    def remove_listener(cls, listener: Callable[[str, 'Base'], None]
+                        ) -> None:
+        """ Stop calling a listener added with add_listener
+        """
+        listeners = LISTENERS.get(cls.__name__, [])
+        if listener in listeners:
+            listeners.remove(listener)
+
+    @classmethod
+    def _dispatch(cls, events: Iterable[Tuple[str, 'Base']]) -> None:
+        """ Run the listeners registered for this class on each event
+        """
+        for event, obj in events:
+            for listener in LISTENERS.get(cls.__name__, ()):
+                listener(event, obj)
+
+    @classmethod
+    @contextmanager
+    def _locked(cls) -> Iterator[None]:
+        """ Hold the class lock file, shared with the other processes
+        using the store files; reentrant, and the caller holds
+        _store_lock
+        """
+        held = LOCK_FILES.get(cls.__name__)
+        if held is None:
+            fd = os.open(".db_{}.lock".format(cls.__name__),
+                         os.O_RDWR | os.O_CREAT, 0o644)
+            held = LOCK_FILES[cls.__name__] = [fd, 0]
+        if held[1] == 0:
+            fcntl.flock(held[0], fcntl.LOCK_EX)
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if held[1] == 0:
+                fcntl.flock(held[0], fcntl.LOCK_UN)
+
+    @classmethod
+    @contextmanager
+    def _writing(cls) -> Iterator[List[Tuple[str, 'Base']]]:
+        """ Hold both locks and catch up on the journal first
+
+        Yield the list of (event, obj) to dispatch, holding the
+        changes read from the journal; the caller appends its own, and
+        listeners run on them all once the locks are released.
+        """
+        events = []
+        try:
+            with _store_lock, cls._locked():
+                events.extend(cls._catch_up())
+                yield events
+        finally:
+            cls._dispatch(events)
+
+    def version(self) -> str:
+        """ Version of this object, changed by every save
+        """
+        return "{}-{}".format(self.id, self.updated_at.isoformat())
+
+    @classmethod
+    def collection_version(cls) -> str:
+        """ Version of the whole collection, changed by every save,
+        remove, load and compaction
+        """
+        counter = VERSIONS.get(cls.__name__, (0, None))[0]
+        return "{}-{}".format(PROCESS_NONCE, counter)
+
+    @classmethod
+    def last_modified(cls) -> Optional[datetime]:
+        """ UTC time of the last change to the collection, if any
+        """
+        return VERSIONS.get(cls.__name__, (0, None))[1]
+
+    @classmethod
+    def stats(cls) -> dict:
+        """ Counters of the class store, without touching any object
+        """
+        return cls.versioned_stats()[1]
+
+    @classmethod
+    def versioned_stats(cls) -> Tuple[str, dict]:
+        """ (collection_version(), stats()) read under the store lock,
+        so the counters are exactly those of that version
+        """
+        paths = (".db_{}.json".format(cls.__name__), cls._index_path(),
+                 cls._journal_path())
+        with _store_lock:
+            counters = COUNTERS.get(cls.__name__, {})
+            last_write = counters.get("last_write")
+            return cls.collection_version(), {
+                "count": cls.count(),
+                "saves": counters.get("saves", 0),
+                "removes": counters.get("removes", 0),
+                "loads": counters.get("loads", 0),
+                "last_write": None if last_write is None
+                else last_write.strftime(TIMESTAMP_FORMAT),
+                "disk_bytes": sum(path.getsize(p) for p in paths
+                                  if path.exists(p)),
+            }
+
+    @classmethod
+    def count(cls) -> int:
+        """ Count all objects
+        """
+        return len(cls._objects())
+
+    @classmethod
+    def all(cls) -> Iterable[TypeVar('Base')]:
+        """ Return all objects
+        """
+        return cls.search()
+
+    @classmethod
+    def get(cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        return cls._objects().get(id)
+
+    @classmethod
+    def page(cls, limit: int, cursor: str = None
+             ) -> Tuple[List[TypeVar('Base')], Optional[str]]:
+        """ Up to limit objects in id order, after the cursor id
+
+        Return:
+          - (objects, next cursor), the cursor being None on the last
+            page; a cursor stays valid if its object is removed
+        """
+        with _store_lock:
+            order = cls._order()
+            start = 0
+            if cursor is not None:
+                start = bisect.bisect_right(order, cursor)
+            ids = order[start:start + limit]
+            objs = cls._objects()
+            found = [objs[obj_id] for obj_id in ids]
+            more = start + limit < len(order)
+        return found, (ids[-1] if more and ids else None)
+
+    @classmethod
+    def iter_ordered(cls, cursor: str = None, limit: int = None,
+                     chunk: int = WARM_CHUNK) -> Iterator[TypeVar('Base')]:
+        """ Objects in id order after the cursor id, fetched chunk by
+        chunk so the store lock is never held between yields
+        """
+        while limit is None or limit > 0:
+            size = chunk if limit is None else min(chunk, limit)
+            found, cursor = cls.page(size, cursor)
+            yield from found
+            if limit is not None:
+                limit -= len(found)
+            if cursor is None:
+                return
+
+    @classmethod
+    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+
+        Indexed attributes narrow the candidates to one hash bucket;
+        the remaining attributes are checked on those candidates only.
+        In lazy mode an indexed attribute is looked up without warming
+        the whole store.
+        """
+        objs = cls._objects()
+        candidates = None
+        if attributes and isinstance(objs, LazyObjects):
+            candidates = objs.lookup(attributes)
+        if candidates is None:
+            cls.ensure_warm()
+            # Copied under the lock: writers resize these dicts
+            with _store_lock:
+                objs = cls._objects()
+                if len(attributes) == 0:
+                    return list(objs.values())
+
+                bucket_of = objs
+                indexes = INDEXES[cls.__name__]
+                for k, v in attributes.items():
+                    if k not in indexes:
+                        continue
+                    try:
+                        bucket = indexes[k].get(v, {})
+                    except TypeError:
+                        continue
+                    if len(bucket) < len(bucket_of):
+                        bucket_of = bucket
+                candidates = list(bucket_of.values())
+
+        def _search(obj):
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        return list(filter(_search, candidates))
+
+    @classmethod
+    def ensure_warm(cls) -> None:
+        """ Materialise every lazily loaded object (needed before any
+        scan or index lookup)
+        """
+        objs = DATA.get(cls.__name__)
+        if isinstance(objs, LazyObjects):
+            with _store_lock:
+                objs.warm()
+                if DATA.get(cls.__name__) is objs:
+                    DATA[cls.__name__] = dict(objs.loaded)
+
+    @classmethod
+    def _warm_up(cls) -> None:
+        """ Background warm-up, in chunks so requests can interleave
+        """
+        objs = DATA.get(cls.__name__)
+        if isinstance(objs, LazyObjects):
+            with _store_lock:
+                keys = iter(list(objs._offsets))
+            while objs.pending() and objs.warm(WARM_CHUNK, keys):
+                time.sleep(0)
+        cls.ensure_warm()
+
+    @classmethod
+    def _map_snapshot(cls, file_path: str) -> Optional[LazyObjects]:
+        """ Map a line-per-object snapshot and read its offset index;
+        None for snapshots in the old single-line layout
+        """
+        with open(file_path, 'rb') as f:
+            if f.read(2) != b"{\n":
+                return None
+            snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = {}
+        values = {}
+        idx_path = cls._index_path()
+        if path.exists(idx_path):
+            with open(idx_path, 'r') as f:
+                header = f.readline().rstrip("\n").split("\t")
+                if header[0] == str(len(snapshot)):
+                    # Values are usable only if recorded for the
+                    # attributes indexed now
+                    if header[1:] != [json.dumps(
+                            list(cls.indexed_attributes))]:
+                        values = None
+                    for line in f:
+                        fields = line.rstrip("\n").split("\t", 3)
+                        obj_id, offset, length = fields[:3]
+                        offsets[obj_id] = (int(offset), int(length))
+                        if values is not None:
+                            values[obj_id] = fields[3]
+        if not offsets and len(snapshot) > 4:
+            offsets = cls._scan_snapshot(snapshot)
+            values = None
+        return LazyObjects(cls, snapshot, offsets, values)
+
+    @staticmethod
+    def _scan_snapshot(snapshot: mmap.mmap) -> dict:
+        """ Rebuild the offset index from the snapshot lines
+        """
+        offsets = {}
+        offset = 0
+        for line in iter(snapshot.readline, b""):
+            split = line.find(b": ")
+            if split != -1:
+                end = len(line.rstrip(b",\n"))
+                obj_id = json.loads(line[:split])
+                offsets[obj_id] = (offset + split + 2, end - split - 2)
+            offset += len(line)
+        return offsets
+
+    @classmethod
+    def _index_path(cls) -> str:
+        """ Path of the snapshot offset index
+        """
+        return ".db_{}.idx".format(cls.__name__)
+
+    @staticmethod
+    def _sync(f) -> None:
+        """ Flush a file and fsync it unless the policy is never
+        """
+        f.flush()
+        if FSYNC_POLICY != "never":
+            os.fsync(f.fileno())
+
+    @classmethod
+    def _objects(cls) -> dict:
+        """ Objects of this class keyed by id
+        """
+        s_class = cls.__name__
+        if DATA.get(s_class) is None:
+            DATA[s_class] = {}
+            INDEXES[s_class] = {k: {} for k in cls.indexed_attributes}
+            ORDERS.pop(s_class, None)
+        return DATA[s_class]
+
+    @classmethod
+    def _order(cls) -> List[str]:
+        """ Sorted ids of this class, built on first use
+        """
+        objs = cls._objects()
+        order = ORDERS.get(cls.__name__)
+        if order is None or len(order) != len(objs):
+            order = sorted(objs)
+            ORDERS[cls.__name__] = order
+        return order
+
+    @classmethod
+    def _store(cls, obj: TypeVar('Base')) -> None:
+        """ Insert or replace an object and index it
+        """
+        objs = cls._objects()
+        if obj.id in objs:
+            cls._index_remove(objs.pop(obj.id), cls.indexed_attributes)
+        else:
+            order = ORDERS.get(cls.__name__)
+            if order is not None:
+                bisect.insort(order, obj.id)
+        objs[obj.id] = obj
+        cls._index_add(obj, cls.indexed_attributes)
+        cls._touch()
+
+    @classmethod
+    def _unstore(cls, obj_id: str) -> TypeVar('Base'):
+        """ Drop an object and its index entries, and return it
+        """
+        obj = cls._objects().pop(obj_id)
+        cls._index_remove(obj, cls.indexed_attributes)
+        order = ORDERS.get(cls.__name__)
+        if order is not None:
+            i = bisect.bisect_left(order, obj_id)
+            if i < len(order) and order[i] == obj_id:
+                del order[i]
+        cls._touch()
+        return obj
+
+    @classmethod
+    def _count(cls, op: str, n: int = 1) -> None:
+        """ Increment an operation counter; saves and removes are writes
+        """
+        counters = COUNTERS.setdefault(cls.__name__, {})
+        counters[op] = counters.get(op, 0) + n
+        if op != "loads":
+            counters["last_write"] = datetime.utcnow()
+
+    @classmethod
+    def _touch(cls) -> None:
+        """ Bump the collection version
+        """
+        counter = VERSIONS.get(cls.__name__, (0, None))[0]
+        VERSIONS[cls.__name__] = (counter + 1, datetime.utcnow())
+
+    @classmethod
+    def _index_add(cls, obj: TypeVar('Base'), attributes: Iterable[str]):
+        """ Add obj to the buckets of the given indexed attributes
+        """
+        indexes = INDEXES[cls.__name__]
+        for k in attributes:
+            try:
+                indexes[k].setdefault(getattr(obj, k, None), {})[obj.id] = obj
+            except TypeError:
+                pass
+
+    @classmethod
+    def _index_remove(cls, obj: TypeVar('Base'), attributes: Iterable[str]):
+        """ Remove obj from the buckets of the given indexed attributes
+        """
+        indexes = INDEXES[cls.__name__]
+        for k in attributes:
+            try:
+                value = getattr(obj, k, None)
+                bucket = indexes[k].get(value)
+            except TypeError:
+                continue
+            if bucket is not None:
+                bucket.pop(obj.id, None)
+                if not bucket:
+                    del indexes[k][value]
+
+    @classmethod
+    def _journal_path(cls) -> str:
+        """ Path of the class journal
+        """
+        return ".db_{}.journal".format(cls.__name__)
+
+    @classmethod
+    def _journal_append(cls, entry: dict, compact: bool = True) -> None:
+        """ Append one entry, honouring the fsync policy, and compact
+        once the journal holds COMPACT_EVERY entries (unless compact is
+        False: callers journal before applying, then compact)
+
+        The caller is inside _writing(), so the journal is open and
+        read to its end.
+        """
+        journal = JOURNALS[cls.__name__]
+        line = json.dumps(entry).encode() + b"\n"
+        if os.write(journal["fd"], line) != len(line):
+            # Cut off by the next read of the journal
+            raise OSError("short write to {}".format(cls._journal_path()))
+        journal["offset"] += len(line)
+        now = time.monotonic()
+        if FSYNC_POLICY == "always" or (
+                FSYNC_POLICY == "interval"
+                and now - journal["synced"] >= FSYNC_INTERVAL):
+            os.fsync(journal["fd"])
+            journal["synced"] = now
+            journal["dirty"] = False
+        elif FSYNC_POLICY == "interval":
+            # Synced by _fsync_loop if no later write does it
+            journal["dirty"] = True
+            _start_fsync_thread()
+        journal["entries"] += cls._entry_weight(entry)
+        if compact:
+            cls._compact_if_due()
+
+    @classmethod
+    def _compact_if_due(cls) -> None:
+        """ Compact once the journal holds COMPACT_EVERY entries
+        """
+        journal = JOURNALS.get(cls.__name__)
+        if journal is not None and journal["entries"] >= COMPACT_EVERY:
+            cls.save_to_file()
+
+    @staticmethod
+    def _generation_line(n: int) -> bytes:
+        """ First line of the journal started by the n-th compaction
+        """
+        return json.dumps({"op": "generation", "n": n}).encode() + b"\n"
+
+    @classmethod
+    def _open_journal(cls, replay: bool) -> None:
+        """ Open the journal, creating it if needed, and read it to its
+        end; with replay, its entries are applied to the store
+
+        The caller holds both locks.
+        """
+        cls._read_journal(cls._attach_journal(), [] if replay else None)
+
+    @classmethod
+    def _attach_journal(cls) -> dict:
+        """ Open the journal, creating it if needed, as unread
+        """
+        fd = os.open(cls._journal_path(),
+                     os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        journal = {"fd": fd, "ino": os.fstat(fd).st_ino, "gen": 0,
+                   "offset": 0, "entries": 0, "synced": time.monotonic(),
+                   "dirty": False}
+        JOURNALS[cls.__name__] = journal
+        return journal
+
+    @classmethod
+    def _read_journal(cls, journal: dict, events: Optional[list]) -> None:
+        """ Read the complete lines after journal["offset"], applying
+        them to the store unless events is None, and add the resulting
+        (event, obj) to events
+
+        The caller holds both locks, so no write is in progress: an
+        incomplete or unreadable last line was left by a crash and is
+        cut off.
+        """
+        fd = journal["fd"]
+        size = os.fstat(fd).st_size
+        data = os.pread(fd, size - journal["offset"], journal["offset"])
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry["op"] == "generation":
+                journal["gen"] = entry["n"]
+            else:
+                if events is not None:
+                    cls._apply_entry(entry, events)
+                journal["entries"] += cls._entry_weight(entry)
+            journal["offset"] += len(line)
+        if journal["offset"] < size:
+            os.ftruncate(fd, journal["offset"])
+
+    @classmethod
+    def _catch_up(cls) -> List[Tuple[str, 'Base']]:
+        """ Apply what other processes journaled since this one last
+        read the journal, following it across their compactions
+
+        The caller holds both locks. Return the (event, obj) pairs for
+        the listeners.
+        """
+        journal = JOURNALS.get(cls.__name__)
+        if journal is None:
+            # Nothing loaded to keep in step: start from the end
+            cls._open_journal(replay=False)
+            return []
+        events = []
+        cls._read_journal(journal, events)
+        try:
+            moved = os.stat(cls._journal_path()).st_ino != journal["ino"]
+        except FileNotFoundError:
+            moved = True
+        if not moved:
+            return events
+        # Compacted elsewhere after everything read so far: the new
+        # journal follows on only if it is the very next generation
+        header = cls._generation_line(journal["gen"] + 1)
+        cls._close_journal()
+        journal = cls._attach_journal()
+        if os.pread(journal["fd"], len(header), 0) != header:
+            cls.load_from_file()
+            return [("reload", None)]
+        cls._read_journal(journal, events)
+        return events
+
+    @classmethod
+    def _journal_current(cls) -> bool:
+        """ True if no other process wrote since the journal was last
+        read (or nothing was loaded); the caller holds _store_lock
+        """
+        journal = JOURNALS.get(cls.__name__)
+        if journal is None:
+            return True
+        try:
+            return (os.fstat(journal["fd"]).st_size == journal["offset"]
+                    and os.stat(cls._journal_path()).st_ino
+                    == journal["ino"])
+        except FileNotFoundError:
+            return False
+
+    @classmethod
+    def _apply_entry(cls, entry: dict, events: list) -> None:
+        """ Apply one journal entry to the store, adding the resulting
+        (event, obj) to events
+        """
+        if entry["op"] == "upsert":
+            obj = cls(**entry["obj"])
+            cls._store(obj)
+            events.append(("save", obj))
+        elif entry["op"] == "batch":
+            for op in entry["ops"]:
+                cls._apply_entry(op, events)
+        elif entry["id"] in cls._objects():
+            events.append(("remove", cls._unstore(entry["id"])))
+
+    @staticmethod
+    def _entry_weight(entry: dict) -> int:
+        """ Number of operations in an entry, for compaction
+        """
+        return len(entry["ops"]) if entry["op"] == "batch" else 1
+
+    @classmethod
+    def _close_journal(cls) -> None:
+        """ Close the open journal, if any, fsyncing what the interval
+        policy has not synced yet
+        """
+        journal = JOURNALS.pop(cls.__name__, None)
+        if journal is not None:
+            if journal["dirty"]:
+                os.fsync(journal["fd"])
+            os.close(journal["fd"])
+
+    def _is_stored(self) -> bool:
+        """ True if this exact instance is held by the store
+        """
+        objs = DATA.get(self.__class__.__name__, {})
+        loaded = getattr(objs, "loaded", objs)
+        return loaded.get(getattr(self, 'id', None)) is self
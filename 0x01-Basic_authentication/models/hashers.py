@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+""" Password hashers module
+
+Stored hashes are tagged "<algorithm>$<parameters>$...", except legacy
+unsalted SHA-256 hex digests which carry no tag.
+"""
+from abc import ABC, abstractmethod
+from models.lru import DigestLRU
+from os import getenv
+from typing import Dict, Tuple
+import base64
+import hashlib
+import hmac
+import importlib.util
+import os
+
+
+class Hasher(ABC):
+    """ Base class of the password hashing schemes
+    """
+
+    algorithm = None
+
+    @abstractmethod
+    def encode(self, pwd: str) -> str:
+        """ Hash pwd into a tagged string
+        """
+
+    @abstractmethod
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check pwd against a hash made by this scheme
+        """
+
+    def needs_update(self, encoded: str) -> bool:
+        """ True if encoded was made with outdated parameters
+        """
+        return False
+
+
+class SHA256Hasher(Hasher):
+    """ Legacy unsalted SHA-256, stored as a bare hex digest
+    """
+
+    algorithm = "sha256"
+
+    def encode(self, pwd: str) -> str:
+        """ Hash pwd into a hex digest
+        """
+        return hashlib.sha256(pwd.encode()).hexdigest().lower()
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check pwd in constant time
+        """
+        return hmac.compare_digest(self.encode(pwd), encoded)
+
+
+class PBKDF2Hasher(Hasher):
+    """ PBKDF2-HMAC-SHA256 from hashlib
+    """
+
+    algorithm = "pbkdf2_sha256"
+    iterations = int(getenv("USER_PBKDF2_ITERATIONS", "260000"))
+
+    def encode(self, pwd: str) -> str:
+        """ Hash pwd with a random salt
+        """
+        salt = _b64(os.urandom(16))
+        return "{}${}${}${}".format(
+            self.algorithm, self.iterations, salt,
+            self._derive(pwd, salt, self.iterations))
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check pwd in constant time
+        """
+        _, iterations, salt, expected = encoded.split("$")
+        actual = self._derive(pwd, salt, int(iterations))
+        return hmac.compare_digest(actual, expected)
+
+    def needs_update(self, encoded: str) -> bool:
+        """ True if the iteration count differs from the configured one
+        """
+        return int(encoded.split("$")[1]) != self.iterations
+
+    @staticmethod
+    def _derive(pwd: str, salt: str, iterations: int) -> str:
+        """ Base64 PBKDF2-HMAC-SHA256 digest of pwd
+        """
+        return _b64(hashlib.pbkdf2_hmac(
+            "sha256", pwd.encode(), salt.encode(), iterations))
+
+
+class ScryptHasher(Hasher):
+    """ scrypt from hashlib
+    """
+
+    algorithm = "scrypt"
+    n, r, p = 2 ** 14, 8, 1
+
+    def encode(self, pwd: str) -> str:
+        """ Hash pwd with a random salt
+        """
+        salt = _b64(os.urandom(16))
+        return "{}${}${}${}${}${}".format(
+            self.algorithm, self.n, self.r, self.p, salt,
+            self._derive(pwd, salt, self.n, self.r, self.p))
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check pwd in constant time
+        """
+        _, n, r, p, salt, expected = encoded.split("$")
+        actual = self._derive(pwd, salt, int(n), int(r), int(p))
+        return hmac.compare_digest(actual, expected)
+
+    def needs_update(self, encoded: str) -> bool:
+        """ True if the cost parameters differ from the configured ones
+        """
+        params = tuple(int(v) for v in encoded.split("$")[1:4])
+        return params != (self.n, self.r, self.p)
+
+    @staticmethod
+    def _derive(pwd: str, salt: str, n: int, r: int, p: int) -> str:
+        """ Base64 scrypt digest of pwd
+        """
+        return _b64(hashlib.scrypt(pwd.encode(), salt=salt.encode(),
+                                   n=n, r=r, p=p, maxmem=2 ** 26))
+
+
+class BCryptHasher(Hasher):
+    """ bcrypt, available when the bcrypt package is installed
+    """
+
+    algorithm = "bcrypt"
+    rounds = int(getenv("USER_BCRYPT_ROUNDS", "12"))
+
+    def encode(self, pwd: str) -> str:
+        """ Hash pwd with a random salt
+        """
+        import bcrypt
+        hashed = bcrypt.hashpw(pwd.encode(), bcrypt.gensalt(self.rounds))
+        return "{}${}".format(self.algorithm, hashed.decode())
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check pwd; bcrypt compares in constant time
+        """
+        import bcrypt
+        hashed = encoded[len(self.algorithm) + 1:].encode()
+        return bcrypt.checkpw(pwd.encode(), hashed)
+
+    def needs_update(self, encoded: str) -> bool:
+        """ True if the work factor differs from the configured one
+        """
+        return int(encoded.split("$")[3]) != self.rounds
+
+
+class VerificationCache(DigestLRU):
+    """ LRU of successful (hash, password) checks
+
+    Entries include the stored hash, so a password change never hits a
+    stale entry.
+    """
+
+    def contains(self, pwd: str, encoded: str) -> bool:
+        """ True if this pair was verified before
+        """
+        return self.lookup(self.digest(encoded, pwd), False)
+
+    def add(self, pwd: str, encoded: str) -> None:
+        """ Remember a successful check
+        """
+        self.store(self.digest(encoded, pwd), True)
+
+
+HASHERS: Dict[str, Hasher] = {}
+DEFAULT_HASHER = getenv("USER_PASSWORD_HASHER", "pbkdf2_sha256")
+verification_cache = VerificationCache(
+    int(getenv("USER_VERIFY_CACHE_SIZE", "1024")))
+
+
+def register_hasher(hasher: Hasher) -> None:
+    """ Make a scheme available for encoding and verification
+    """
+    HASHERS[hasher.algorithm] = hasher
+
+
+def identify(encoded: str) -> Hasher:
+    """ Scheme of a stored hash, from its tag
+    """
+    algorithm = encoded.split("$", 1)[0] if "$" in encoded else "sha256"
+    hasher = HASHERS.get(algorithm)
+    if hasher is None:
+        raise ValueError("unknown password hash scheme")
+    return hasher
+
+
+def make_password(pwd: str, algorithm: str = None) -> str:
+    """ Hash pwd with the default (or given) scheme
+    """
+    return HASHERS[algorithm or DEFAULT_HASHER].encode(pwd)
+
+
+def check_password(pwd: str, encoded: str) -> Tuple[bool, bool]:
+    """ Verify pwd against a stored hash
+
+    Return:
+      - (valid, needs_update): needs_update is True when the password
+        is right but the hash should be regenerated with the default
+        scheme or its current parameters
+    """
+    hasher = identify(encoded)
+    if not verification_cache.contains(pwd, encoded):
+        if not hasher.verify(pwd, encoded):
+            return False, False
+        verification_cache.add(pwd, encoded)
+    outdated = hasher.algorithm != DEFAULT_HASHER \
+        or hasher.needs_update(encoded)
+    return True, outdated
+
+
+def _b64(raw: bytes) -> str:
+    """ Standard base64 of raw, as text
+    """
+    return base64.b64encode(raw).decode()
+
+
+register_hasher(SHA256Hasher())
+register_hasher(PBKDF2Hasher())
+if hasattr(hashlib, "scrypt"):
+    register_hasher(ScryptHasher())
+# bcrypt itself is imported on first use
+if importlib.util.find_spec("bcrypt") is not None:
+    register_hasher(BCryptHasher())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+""" Digest-keyed LRU module
+
+Shared by the password verification cache and the API credential cache.
+"""
+from collections import OrderedDict
+from typing import Any
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+
+class DigestLRU():
+    """ Bounded, thread-safe LRU keyed by HMAC-SHA256 digests
+
+    Keys are HMACs under a per-process random key, so the cache never
+    holds the secrets it was keyed on. Entries optionally expire ttl
+    seconds after they were stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        """ Initialize an empty cache
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """ Number of entries, expired ones included
+        """
+        return len(self._entries)
+
+    def digest(self, *parts: str) -> bytes:
+        """ HMAC of parts joined by NUL, used as the key of an entry
+        """
+        message = "\0".join(parts).encode()
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def lookup(self, digest: bytes, default: Any = None) -> Any:
+        """ Value stored under digest, or default if absent or expired
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] is not None \
+                    and entry[1] < time.monotonic():
+                self._drop(digest)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def store(self, digest: bytes, value: Any) -> None:
+        """ Store value under digest, evicting the least recent entries
+        """
+        if self.maxsize <= 0:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+            self._entries[digest] = (value, expires)
+            self._added(digest, value)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def discard(self, digest: bytes) -> None:
+        """ Remove the entry of digest, if any
+        """
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+
+    def clear(self) -> None:
+        """ Forget every entry
+        """
+        with self._lock:
+            for digest in list(self._entries):
+                self._drop(digest)
+
+    def stats(self) -> dict:
+        """ Hit/miss/eviction counters and the current size
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+    def _drop(self, digest: bytes) -> None:
+        """ Remove an entry; the caller holds the lock
+        """
+        self._dropped(digest, self._entries.pop(digest)[0])
+
+    def _added(self, digest: bytes, value: Any) -> None:
+        """ Hook called, under the lock, after an entry is stored
+        """
+
+    def _dropped(self, digest: bytes, value: Any) -> None:
+        """ Hook called, under the lock, after an entry leaves the cache
+        """
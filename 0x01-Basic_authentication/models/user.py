@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
+from models import hashers
 from models.base import Base
 
 
@@ -9,6 +9,10 @@ class User(Base):
     """ User class
     """
 
+    __slots__ = ("email", "_password", "first_name", "last_name")
+
+    indexed_attributes = ("email",)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -26,22 +30,29 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hash with the default hasher
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = hashers.make_password(pwd)
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
+
+        A valid password stored with an outdated scheme is rehashed,
+        and saved if the user is in the store.
         """
         if pwd is None or type(pwd) is not str:
             return False
         if self.password is None:
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        valid, outdated = hashers.check_password(pwd, self.password)
+        if valid and outdated:
+            self.password = pwd
+            if self._is_stored():
+                self.save()
+        return valid
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
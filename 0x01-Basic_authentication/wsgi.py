@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+""" WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from api.v1.app import app
+from models.user import User
+
+# Build every stored object before the workers are forked
+User.ensure_warm()
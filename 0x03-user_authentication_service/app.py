@@ -131,4 +131,4 @@ def update_password() -> str:
 
 # Main Entry Point
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port="5000")
+    app.run(host="0.0.0.0", port=5000)
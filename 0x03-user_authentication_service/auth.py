@@ -3,6 +3,7 @@
 Authentication module: provides functions and classes to handle user authentication,
 password hashing, session management, and password reset functionality.
 """
+import os
 import bcrypt
 from uuid import uuid4
 from sqlalchemy.orm.exc import NoResultFound
@@ -12,6 +13,7 @@ from db import DB
 from user import User
 
 U = TypeVar(User)
+BCRYPT_ROUNDS = int(os.getenv("AUTH_BCRYPT_ROUNDS", "12"))
 
 
 def _hash_password(password: str) -> bytes:
@@ -22,7 +24,20 @@ def _hash_password(password: str) -> bytes:
     Returns:
         bytes: The hashed password.
     """
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(BCRYPT_ROUNDS))
+
+
+def _needs_rehash(hashed_password: bytes) -> bool:
+    """
+    Check whether a bcrypt hash was made with a cost other than
+    BCRYPT_ROUNDS.
+    Args:
+        hashed_password (bytes): Stored hash ($2b$<rounds>$...).
+    Returns:
+        bool: True if the hash should be regenerated.
+    """
+    return int(hashed_password.split(b"$")[2]) != BCRYPT_ROUNDS
 
 
 def _generate_uuid() -> str:
@@ -68,6 +83,7 @@ class Auth:
     def valid_login(self, email: str, password: str) -> bool:
         """
         Validate user login credentials.
+        A hash made with an outdated cost is replaced on success.
         Args:
             email (str): User's email address.
             password (str): User's plain-text password.
@@ -76,9 +92,15 @@ class Auth:
         """
         try:
             user = self._db.find_user_by(email=email)
-            return bcrypt.checkpw(password.encode('utf-8'), user.hashed_password)
         except NoResultFound:
             return False
+        if not bcrypt.checkpw(password.encode('utf-8'), user.hashed_password):
+            return False
+        if _needs_rehash(user.hashed_password):
+            self._db.update_user(
+                user.id, hashed_password=_hash_password(password)
+            )
+        return True
 
     def create_session(self, email: str) -> Union[None, str]:
         """
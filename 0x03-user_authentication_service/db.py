@@ -40,6 +40,21 @@ class DB:
             self.__session = DBSession()
         return self.__session
 
+    def dispose(self) -> None:
+        """
+        Forget the session and the pooled connections without closing
+        them. A forked worker calls this so that it opens its own
+        connections instead of sharing the parent's.
+        """
+        self.__session = None
+        try:
+            # The close argument appeared in SQLAlchemy 1.4.33
+            self._engine.dispose(close=False)
+        except TypeError:
+            # What dispose(close=False) does: a fresh pool, the old one
+            # left to the parent
+            self._engine.pool = self._engine.pool.recreate()
+
     def add_user(self, email: str, hashed_password: str) -> User:
         """
         Add a new user to the database.
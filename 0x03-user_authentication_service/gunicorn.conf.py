@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+gunicorn settings for the user authentication service.
+
+Usage: gunicorn -c gunicorn.conf.py app:app
+
+The app is loaded once in the master (DB() recreates the schema, so it
+must run only once), then workers are forked from it.
+"""
+import os
+
+bind = "{}:{}".format(os.getenv("API_HOST", "0.0.0.0"),
+                      int(os.getenv("API_PORT", "5000")))
+workers = int(os.getenv("API_WORKERS", str(os.cpu_count() or 1)))
+# DB keeps a single SQLAlchemy session, which is not thread-safe
+threads = int(os.getenv("API_THREADS", "1"))
+preload_app = True
+
+
+def post_fork(server, worker) -> None:
+    """
+    Give each worker its own database connections.
+    """
+    from app import AUTH
+
+    AUTH._db.dispose()